@@ -1,6 +1,6 @@
 # FastAPI
-from fastapi import FastAPI, HTTPException, Query, Depends, Request, Response, status
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Query, Header, Depends, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 import uvicorn
 
 # Security & Middleware
@@ -12,8 +12,16 @@ import secrets
 import os
 import sys
 import signal
-
-from utils.logger import get_logger
+import asyncio
+import orjson
+from contextlib import asynccontextmanager
+
+from utils.logger import get_logger, DEBUG
+from utils.export import parse_fields, encode_stream
+from utils.profiler import get_query_profiler
+from utils.compression import CompressionMiddleware, decode_etag
+from utils.metrics import TimingMiddleware, get_request_metrics, get_pool_metrics
+from utils.enumerations.export import ExportFormat, getExportMediaType
 from utils.database import *
 from models import *
 from mongo import *
@@ -27,7 +35,34 @@ LOG_SYS = get_logger()
 TAG = "FastAPI"
 
 TAG_ADMIN = ["Admin"]
-ACCESS_TOKEN = secrets.token_hex(16)
+# Shared by all the worker processes (the main process passes its own to the workers)
+ACCESS_TOKEN = os.environ.get("ACCESS_TOKEN") or secrets.token_hex(16)
+
+# Server settings (override with environment variables, inherited by the worker processes)
+SERVER_HOST = os.environ.get("SERVER_HOST", "localhost")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", 8000))
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 1))
+MONGO_HOST = os.environ.get("MONGO_HOST", "localhost")
+MONGO_PORT = int(os.environ.get("MONGO_PORT", 27017))
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "WTFunko")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A worker process (or a server started with the uvicorn command) connects here,
+    # the population and the indexes are done once under a lock in the database
+    if not is_connected():
+        await asyncio.to_thread(connect, host=MONGO_HOST, port=MONGO_PORT, db_name=MONGO_DB_NAME)
+    # Open the pool connections on the server event loop, before the first requests
+    await prewarm_connections()
+    # Follow the catalog changes made by the other processes
+    watcher = asyncio.create_task(watch_catalog()) if CATALOG_WATCH_INTERVAL > 0 else None
+    # Keep the id worker number of this process
+    id_worker = asyncio.create_task(keep_id_worker())
+    yield
+    id_worker.cancel()
+    if watcher is not None:
+        watcher.cancel()
+        await publish_stock_changes()
 
 app = FastAPI(title="FastAPI - WTFunko",
               summary="Some easy API for WTFunko Store.",
@@ -43,7 +78,8 @@ app = FastAPI(title="FastAPI - WTFunko",
                   "name": "GNU General Public License v3",
                   "url": "https://opensource.org/license/gpl-3-0/"
               },
-              version="1.0"
+              version="1.0",
+              lifespan=lifespan
               )
 
 origins = [
@@ -60,8 +96,48 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"]
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(TimingMiddleware)
+
+
+def verify_access_token(x_access_token: str = Header(None, description="Access token printed at the server startup")):
+    if x_access_token is None or not secrets.compare_digest(x_access_token, ACCESS_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid access token.")
+
+def export_response(collection_name: str, export_format: ExportFormat, fields: str = None, compress: bool = False):
+    # Stream the whole collection in batches instead of building one big list
+    documents = stream_documents(collection_name, parse_fields(fields))
+    headers = {"Content-Encoding": "gzip"} if compress else None
+    return StreamingResponse(encode_stream(documents, export_format, compress),
+                             media_type=getExportMediaType(export_format), headers=headers)
+
+# Body of the bulk endpoints, read by hand to accept both JSON and NDJSON
+BULK_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {"type": "object", "description": "Bulk operation: op, key and data"}}},
+            "application/x-ndjson": {"schema": {"type": "string", "description": "One operation per line"}}
+        }
+    }
+}
+
+
+async def read_bulk_operations(request: Request) -> list:
+    # A JSON array of operations, or one operation per line for an NDJSON upload
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            return [orjson.loads(line) for line in body.splitlines() if line.strip()]
+        operations = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    if not isinstance(operations, list):
+        raise HTTPException(status_code=400, detail="The body must be an array of operations.")
+    return operations
 
 ###################################################################################################
 
@@ -75,10 +151,10 @@ async def login(request: Request,
                 user: User):
     try:
         LOG_SYS.write(TAG, f"Login user with username: {user.username} and password: {user.password}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         user_data = await get_user(user.username)
-        if hash_string_match(user.password, user_data.password):
+        if await async_hash_string_match(user.password, user_data.password):
             return user_data
         else:
             raise HTTPException(
@@ -99,8 +175,8 @@ async def signup(request: Request,
                  user: User):
     try:
         LOG_SYS.write(TAG, f"Signup user with username: {user.username} and email: {user.email}")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         user_data = await insert_user(user)
         return user_data
     except HTTPException as http_err:
@@ -118,8 +194,8 @@ async def deleteAccount(request: Request,
                         username: str):
     try:
         LOG_SYS.write(TAG, f"Delete all user orders with username: {username}")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         resultOrders = await delete_orders_by_username(username)
         LOG_SYS.write(TAG, f"Delete all user data with username: {username}")
         resultUser = await delete_user(username)
@@ -137,11 +213,16 @@ async def deleteAccount(request: Request,
 @app.get("/getAllUsers", response_model=List[User], status_code=200, tags=TAG_ADMIN,
          summary="Get All Users",
          description="Retrieve all users available in the database.")
-async def getAllUsers(request: Request):
+async def getAllUsers(request: Request,
+                      stream: ExportFormat = Query(None, description="Stream the users as NDJSON lines or as a chunked JSON array."),
+                      fields: str = Query(None, description="Comma separated user fields (e.g. _id,username,email) to export when streaming (default all)."),
+                      compress: bool = Query(False, description="Compress the stream with gzip.")):
     try:
         LOG_SYS.write(TAG, f"Getting all users from Database.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        if stream is not None:
+            return export_response("Users", stream, fields, compress)
         users = await get_all_users()
         return users
     except HTTPException as http_err:
@@ -160,8 +241,8 @@ async def getUser(request: Request,
                   email: str = Query(None, description="The email of the user to retrieve. If not provided, the user will be retrieved by username.")):
     try:
         LOG_SYS.write(TAG, f"Getting user information with username: {username} or email: {email}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         user_data = await get_user(username, email)
         return user_data
     except HTTPException as http_err:
@@ -178,8 +259,8 @@ async def getUser(request: Request,
 async def insertUser(request: Request, user: User):
     try:
         LOG_SYS.write(TAG, f"Insert new user information with username: {user.username}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await insert_user(user)
         return {"message": result}
     except HTTPException as http_err:
@@ -197,8 +278,8 @@ async def delete_existing_user(request: Request,
                                username: str):
     try:
         LOG_SYS.write(TAG, f"Delete existing user information with username: {username}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await delete_user(username)
         return {"message": result}
     except HTTPException as http_err:
@@ -215,8 +296,8 @@ async def delete_existing_user(request: Request,
 async def clearUsers(request: Request):
     try:
         LOG_SYS.write(TAG, f"Clearing Users collection.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await clear_users()
         return {"message": result}
     except HTTPException as http_err:
@@ -235,8 +316,8 @@ async def updateUser(request: Request,
                      user: Optional[Union[User, Dict[str, Any]]]):
     try:
         LOG_SYS.write(TAG, f"Update existing user information with username: {username}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await update_user(username, user)
         return {"message": result}
     except HTTPException as http_err:
@@ -246,6 +327,23 @@ async def updateUser(request: Request,
         LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/bulkUsers", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)], openapi_extra=BULK_REQUEST_BODY,
+          summary="Bulk Write Users",
+          description="Insert, update and delete users in unordered batches, from a JSON array or an NDJSON upload of operations ({op, key, data}), with a result for every operation. Requires the access token in the X-Access-Token header.")
+async def bulkUsers(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Bulk write of users.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        operations = await read_bulk_operations(request)
+        return await bulk_write_documents("Users", operations)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 ###################################################################################################
 
 TAG_ORDERS = ["Orders"]
@@ -253,11 +351,16 @@ TAG_ORDERS = ["Orders"]
 @app.get("/getAllOrders", response_model=List[Order], status_code=200, tags=TAG_ADMIN,
          summary="Get All Orders",
          description="Retrieve all orders available in the database.")
-async def getAllOrders(request: Request):
+async def getAllOrders(request: Request,
+                       stream: ExportFormat = Query(None, description="Stream the orders as NDJSON lines or as a chunked JSON array."),
+                       fields: str = Query(None, description="Comma separated fields to export when streaming (default all)."),
+                       compress: bool = Query(False, description="Compress the stream with gzip.")):
     try:
         LOG_SYS.write(TAG, f"Getting all orders from Database.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        if stream is not None:
+            return export_response("Orders", stream, fields, compress)
         orders = await get_all_orders()
         return orders
     except HTTPException as http_err:
@@ -275,8 +378,8 @@ async def getUserOrders(request: Request,
                         username: str = Query(..., description="The username of the user whose orders you want to retrieve.")):
     try:
         LOG_SYS.write(TAG, f"Getting all orders information from user account with username: {username}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         orders = await get_orders_by_username(username)
         return orders
     except HTTPException as http_err:
@@ -294,8 +397,8 @@ async def getOrderInfo(request: Request,
                        order_id: Optional[Union[int, str]] = Query(..., description="The ID of the order you want to retrieve.")):
     try:
         LOG_SYS.write(TAG, f"Getting all information of a specific order with id: {order_id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         order_info = await get_order_info(order_id)
         return order_info
     except HTTPException as http_err:
@@ -313,12 +416,9 @@ async def insertOrder(request: Request,
                       order: Order):
     try:
         LOG_SYS.write(TAG, f"Insert new order information by user: {order.user.username}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        insertOrderResult = await insert_order(order)
-
-        LOG_SYS.write(TAG, f"Update stock quantity in the warehouse")
-        await update_product_warehouse(order.products)
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        insertOrderResult = await place_order(order)
         return {"message": insertOrderResult}
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
@@ -335,8 +435,8 @@ async def deleteOrder(request: Request,
                       order_id: Optional[Union[int, str]]):
     try:
         LOG_SYS.write(TAG, f"Delete existing order information with id: {order_id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await delete_order_by_id(order_id)
         return {"message": result}
     except HTTPException as http_err:
@@ -354,8 +454,8 @@ async def deleteOrder(request: Request,
                       username: str):
     try:
         LOG_SYS.write(TAG, f"Delete existing orders information with username: {username}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await delete_orders_by_username(username)
         return {"message": result}
     except HTTPException as http_err:
@@ -372,8 +472,8 @@ async def deleteOrder(request: Request,
 async def clearOrders(request: Request):
     try:
         LOG_SYS.write(TAG, f"Clearing Orders collection.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await clear_orders()
         return {"message": result}
     except HTTPException as http_err:
@@ -392,8 +492,8 @@ async def updateOrder(request: Request,
                       order: Optional[Union[Order, Dict[str, Any]]]):
     try:
         LOG_SYS.write(TAG, f"Update existing order information with id: {order_id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await update_order(order_id, order)
         return {"message": result}
     except HTTPException as http_err:
@@ -403,25 +503,102 @@ async def updateOrder(request: Request,
         LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/bulkOrders", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)], openapi_extra=BULK_REQUEST_BODY,
+          summary="Bulk Write Orders",
+          description="Insert, update and delete orders in unordered batches, from a JSON array or an NDJSON upload of operations ({op, key, data}), with a result for every operation. Requires the access token in the X-Access-Token header.")
+async def bulkOrders(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Bulk write of orders.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        operations = await read_bulk_operations(request)
+        return await bulk_write_documents("Orders", operations)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 ###################################################################################################
 
 TAG_PRODUCTS = ["Products"]
 
 
-@app.get("/getProducts", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+# Cache-Control of the catalog routes, revalidated with the ETag of the catalog version
+CACHE_POLICIES = {
+    "/getProducts": "public, no-cache",
+    "/getAllProducts": "public, max-age=60, must-revalidate",
+    "/getUniqueProductsCount": "public, max-age=30, must-revalidate",
+    "/getProductFacets": "public, max-age=30, must-revalidate",
+    "/getByID/{product_id}": "public, max-age=10, must-revalidate",
+    "/getRelated/{product_id}": "public, max-age=300, must-revalidate",
+    "/getByCategory/{category}": "public, no-cache",
+    "/getByProductType/{product_type}": "public, no-cache",
+    "/getBySearch/{search_string}": "public, no-cache",
+    "/sortingByPrice": "public, no-cache",
+    "/sortingByName": "public, no-cache"
+}
+
+
+def catalog_headers(request: Request) -> dict:
+    # Strong ETag of the catalog version served by this process and Cache-Control of the route
+    return {"ETag": f'"{catalog_version()}"', "Cache-Control": CACHE_POLICIES[request.scope["route"].path]}
+
+
+def not_modified(request: Request, headers: dict):
+    # A 304 when the client already has the current version (in any encoding), before querying the database.
+    # The 304 carries the ETag held by the client, the one of the encoding it got.
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    for etag in if_none_match.split(","):
+        etag = etag.strip().removeprefix("W/")
+        if etag == "*":
+            return Response(status_code=304, headers=headers)
+        if decode_etag(etag) == headers["ETag"]:
+            return Response(status_code=304, headers={**headers, "ETag": etag})
+    return None
+
+
+def products_response(products, headers: dict = None):
+    # Projected documents are encoded straight to JSON, Product and ProductCard models go through the response model
+    sample = products[0] if isinstance(products, list) and products else products
+    if VALIDATE_RESPONSES and isinstance(sample, BaseModel):
+        return products
+    return ORJSONResponse(products, headers=headers)
+
+
+@app.get("/getProducts", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Get Products",
-         description="Retrieve products based on category, search term, sorting criteria, and page index.")
+         description="Retrieve products based on category, search term, sorting criteria, and page index or cursor. "
+                     "Without a page index the products are paginated by cursor: the cursor of the next page "
+                     "is returned in the X-Next-Cursor header (absent on the last page).")
 async def getProducts(request: Request,
+                      response: Response,
                       category: str = Query(..., description="The category of the products to retrieve."),
                       searchTerm: str = Query(..., description="The search term to filter the products."),
                       sortingCriteria: Criteria = Query(..., description="The criteria to sort the products."),
-                      pageIndex: int = Query(..., description="The page index to retrieve the products from.")):
+                      pageIndex: int = Query(None, description="The page index to retrieve the products from."),
+                      cursor: str = Query(None, description="The cursor of the page to retrieve, as returned in X-Next-Cursor."),
+                      fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
     try:
-        LOG_SYS.write(TAG, f"Getting products data with some filters at page index {pageIndex}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await get_products(category, searchTerm, sortingCriteria, pageIndex)
-        return products
+        by_cursor = cursor is not None or pageIndex is None
+        LOG_SYS.write(TAG, f"Getting products data with some filters at {'cursor' if by_cursor else f'page index {pageIndex}'}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        if not by_cursor:
+            products = await get_products(category, searchTerm, sortingCriteria, pageIndex, parse_fields(fields))
+        else:
+            products, next_cursor = await get_products_page(category, searchTerm, sortingCriteria, cursor, parse_fields(fields))
+            if next_cursor is not None:
+                headers["X-Next-Cursor"] = next_cursor
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -430,16 +607,27 @@ async def getProducts(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/getAllProducts", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+@app.get("/getAllProducts", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Get All Products",
          description="Retrieve all products available in the database.")
-async def getAllProducts(request: Request):
+async def getAllProducts(request: Request,
+                         response: Response,
+                         stream: ExportFormat = Query(None, description="Stream the products as NDJSON lines or as a chunked JSON array."),
+                         fields: str = Query(None, description="Comma separated product fields to return, streamed or not (default all the Product fields), or card for the listing cards (_id, title, price, img, interest)."),
+                         compress: bool = Query(False, description="Compress the stream with gzip.")):
     try:
         LOG_SYS.write(TAG, f"Getting all product from Database.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await get_all_products()
-        return products
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        if stream is not None:
+            return export_response("Products", stream, fields, compress)
+        products = await get_all_products(parse_fields(fields))
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -452,13 +640,19 @@ async def getAllProducts(request: Request):
          summary="Get Unique Products Count",
          description="Retrieve the count of unique products for a specific category and search term.")
 async def getUniqueProductsCount(request: Request,
+                                 response: Response,
                                  category: str = Query(..., description="The category of the products to count."),
                                  searchTerm: str = Query(..., description="The search term to filter the products.")):
     try:
         LOG_SYS.write(TAG, f"Getting products count with category: {category} and search string: {searchTerm}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
         count = await get_unique_products_count(category, searchTerm)
+        response.headers.update(headers)
         return count
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
@@ -468,17 +662,47 @@ async def getUniqueProductsCount(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/getProductFacets", status_code=200, tags=TAG_PRODUCTS,
+         summary="Get Product Facets",
+         description="Retrieve, for a category and search term, the count of products by interest, product type, license and vendor.")
+async def getProductFacets(request: Request,
+                           response: Response,
+                           category: str = Query("All", description="The category of the products to count."),
+                           searchTerm: str = Query("", description="The search term to filter the products.")):
+    try:
+        LOG_SYS.write(TAG, f"Getting products facets with category: {category} and search string: {searchTerm}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        facets = await get_product_facets(category, searchTerm)
+        return ORJSONResponse(facets, headers=headers)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/getByID/{product_id}", response_model=Product, status_code=200, tags=TAG_PRODUCTS,
          summary="Get Product by ID",
          description="Retrieve a specific product by its unique identifier.")
 async def getByID(request: Request,
+                  response: Response,
                   product_id: int):
     try:
         LOG_SYS.write(TAG, f"Getting specific product by id: {product_id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
         products = await get_product_by_id(product_id)
-        return products
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -487,17 +711,51 @@ async def getByID(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/getByCategory/{category}", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+@app.get("/getRelated/{product_id}", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
+         summary="Get Related Products",
+         description="Retrieve the related products of a product in one request, completed by the products sharing its licenses and interests.")
+async def getRelated(request: Request,
+                     response: Response,
+                     product_id: int,
+                     limit: int = Query(10, ge=1, le=100, description="The maximum number of related products."),
+                     fallback: bool = Query(True, description="Complete with similar products when there are not enough related ones."),
+                     fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
+    try:
+        LOG_SYS.write(TAG, f"Getting related products of product with id: {product_id}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        products = await get_related_products(product_id, limit, fallback, parse_fields(fields))
+        response.headers.update(headers)
+        return products_response(products, headers)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/getByCategory/{category}", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Get Products by Category",
          description="Retrieve products based on a specific category.")
 async def getByCategory(request: Request,
-                        category: str):
+                        response: Response,
+                        category: str,
+                        fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
     try:
         LOG_SYS.write(TAG, f"Getting products by search category: {category}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await get_products_by_category(category)
-        return products
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        products = await get_products_by_category(category, parse_fields(fields))
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -506,17 +764,24 @@ async def getByCategory(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/getByProductType/{product_type}", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+@app.get("/getByProductType/{product_type}", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Get Products by Product Type",
          description="Retrieve products based on a specific product type.")
 async def getBySearch(request: Request,
-                      product_type: str):
+                      response: Response,
+                      product_type: str,
+                      fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
     try:
         LOG_SYS.write(TAG, f"Getting products by product type: {product_type}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await get_product_by_product_type(product_type)
-        return products
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        products = await get_product_by_product_type(product_type, parse_fields(fields))
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -525,17 +790,24 @@ async def getBySearch(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/getBySearch/{search_string}", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+@app.get("/getBySearch/{search_string}", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Get Products by Search String",
          description="Retrieve products based on a specific search string.")
 async def getBySearch(request: Request,
-                      search_string: str):
+                      response: Response,
+                      search_string: str,
+                      fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
     try:
         LOG_SYS.write(TAG, f"Getting products by search string: {search_string}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await get_product_by_search(search_string)
-        return products
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        products = await get_product_by_search(search_string, parse_fields(fields))
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -544,18 +816,34 @@ async def getBySearch(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/sortingByPrice", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+@app.get("/sortingByPrice", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Sort Products by Price",
-         description="Sort products based on a specified price and order.")
+         description="Sort the products in a price range by price, a page of at most limit products at a time: "
+                     "the cursor of the next page is returned in the X-Next-Cursor header (absent on the last page). "
+                     "With top only the first products are returned, without a cursor.")
 async def sortingByPrice(request: Request,
-                         price: float,
-                         asc: bool):
+                         response: Response,
+                         asc: bool,
+                         price: float = Query(None, description="The maximum price of the products."),
+                         min_price: float = Query(None, description="The minimum price of the products."),
+                         limit: int = Query(SORT_PAGE_SIZE, ge=1, le=SORT_MAX_LIMIT, description="The maximum number of products of a page."),
+                         cursor: str = Query(None, description="The cursor of the page to retrieve, as returned in X-Next-Cursor."),
+                         top: int = Query(None, ge=1, le=SORT_MAX_LIMIT, description="Return only the first top products."),
+                         fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
     try:
-        LOG_SYS.write(TAG, f"Sort products by price: {price} and by asc: {asc}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await sort_product_by_price(price, asc)
-        return products
+        LOG_SYS.write(TAG, f"Sort products by price: {min_price} - {price} and by asc: {asc}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        products, next_cursor = await sort_product_by_price(price, asc, parse_fields(fields), min_price,
+                                                            top or limit, None if top else cursor)
+        if next_cursor is not None and top is None:
+            headers["X-Next-Cursor"] = next_cursor
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -564,17 +852,31 @@ async def sortingByPrice(request: Request,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/sortingByName", response_model=List[Product], status_code=200, tags=TAG_PRODUCTS,
+@app.get("/sortingByName", response_model=List[Union[Product, ProductCard]], status_code=200, tags=TAG_PRODUCTS,
          summary="Sort Products by Name",
-         description="Sort products based on a specified name order.")
-async def sortingByPrice(request: Request,
-                         asc: bool):
+         description="Sort the products by name, a page of at most limit products at a time: "
+                     "the cursor of the next page is returned in the X-Next-Cursor header (absent on the last page). "
+                     "With top only the first products are returned, without a cursor.")
+async def sortingByName(request: Request,
+                        response: Response,
+                        asc: bool,
+                        limit: int = Query(SORT_PAGE_SIZE, ge=1, le=SORT_MAX_LIMIT, description="The maximum number of products of a page."),
+                        cursor: str = Query(None, description="The cursor of the page to retrieve, as returned in X-Next-Cursor."),
+                        top: int = Query(None, ge=1, le=SORT_MAX_LIMIT, description="Return only the first top products."),
+                        fields: str = Query(None, description="Comma separated product fields to return, or card for the listing cards (_id, title, price, img, interest).")):
     try:
         LOG_SYS.write(TAG, f"Sort products by name in asc order: {asc}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
-        products = await sort_product_by_name(asc)
-        return products
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        headers = catalog_headers(request)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+        products, next_cursor = await sort_product_by_name(asc, parse_fields(fields), top or limit, None if top else cursor)
+        if next_cursor is not None and top is None:
+            headers["X-Next-Cursor"] = next_cursor
+        response.headers.update(headers)
+        return products_response(products, headers)
     except HTTPException as http_err:
         LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
         raise http_err
@@ -590,8 +892,8 @@ async def insertProduct(request: Request,
                         product: Product):
     try:
         LOG_SYS.write(TAG, f"Insert new product information with id: {product._id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await insert_product(product)
         return {"message": result}
     except HTTPException as http_err:
@@ -609,8 +911,8 @@ async def deleteProduct(request: Request,
                         product_id: int):
     try:
         LOG_SYS.write(TAG, f"Delete existing product information with id: {product_id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await delete_product(product_id)
         return {"message": result}
     except HTTPException as http_err:
@@ -627,8 +929,8 @@ async def deleteProduct(request: Request,
 async def clearProducts(request: Request):
     try:
         LOG_SYS.write(TAG, f"Clearing Products collection.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await clear_products()
         return {"message": result}
     except HTTPException as http_err:
@@ -647,8 +949,8 @@ async def updateProduct(request: Request,
                         product: Optional[Union[Product, Dict[str, Any]]]):
     try:
         LOG_SYS.write(TAG, f"Update existing product information with id: {product_id}.")
-        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.")
-        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
         result = await update_product(product_id, product)
         return {"message": result}
     except HTTPException as http_err:
@@ -658,6 +960,136 @@ async def updateProduct(request: Request,
         LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/bulkProducts", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)], openapi_extra=BULK_REQUEST_BODY,
+          summary="Bulk Write Products",
+          description="Insert, update and delete products in unordered batches, from a JSON array or an NDJSON upload of operations ({op, key, data}), with a result for every operation. Requires the access token in the X-Access-Token header.")
+async def bulkProducts(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Bulk write of products.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        operations = await read_bulk_operations(request)
+        return await bulk_write_documents("Products", operations)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/getCacheStats", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)],
+         summary="Get Cache Statistics",
+         description="Retrieve size, hit, miss, eviction and invalidation counters of the product caches. Requires the access token in the X-Access-Token header.")
+async def getCacheStats(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Getting product caches statistics.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        return get_cache_stats()
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@app.get("/getIndexReport", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)],
+         summary="Get Index Report",
+         description="Retrieve the indexes of the collections, the explain() plans of the query shapes (flagging the ones not served by an index) and the unused indexes. Requires the access token in the X-Access-Token header.")
+async def getIndexReport(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Getting the index report.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        return await asyncio.to_thread(get_index_report)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/getQueryStats", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)],
+         summary="Get Query Statistics",
+         description="Retrieve the latency histograms, documents examined and returned and indexes used by the sampled data-access calls (enable with QUERY_PROFILING=true). Requires the access token in the X-Access-Token header.")
+async def getQueryStats(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Getting data-access profiling statistics.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        return get_query_profiler().stats()
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/getRequestStats", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)],
+         summary="Get Request Statistics",
+         description="Retrieve the in-flight requests and, for every route, the latency percentiles, response bytes and status codes (slowest routes first). Requires the access token in the X-Access-Token header.")
+async def getRequestStats(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Getting request timing statistics.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        return get_request_metrics().stats()
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/getPoolStats", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)],
+         summary="Get Connection Pool Statistics",
+         description="Retrieve, for every MongoDB client, the open and checked out connections, the operations waiting for one, the saturation of the pool and the checkout wait percentiles. Requires the access token in the X-Access-Token header.")
+async def getPoolStats(request: Request):
+    try:
+        LOG_SYS.write(TAG, f"Getting connection pool statistics.")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        return get_pool_metrics().stats()
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)], response_class=PlainTextResponse,
+         summary="Prometheus Metrics",
+         description="Expose the request timing, connection pool and data-access profiling statistics in the Prometheus text format. Requires the access token in the X-Access-Token header.")
+async def metrics():
+    try:
+        content = get_request_metrics().prometheus() + get_pool_metrics().prometheus() + get_query_profiler().prometheus()
+        return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/syncCatalog", status_code=200, tags=TAG_ADMIN, dependencies=[Depends(verify_access_token)],
+          summary="Sync Products Catalog",
+          description="Apply the changes of the products dataset to the database (inserts, updates and deletes), keeping the stock quantities. Requires the access token in the X-Access-Token header.")
+async def syncCatalog(request: Request,
+                      delete: bool = Query(True, description="Delete the products missing from the dataset"),
+                      dry_run: bool = Query(False, description="Only count the changes, without applying them")):
+    try:
+        LOG_SYS.write(TAG, f"Syncing the products catalog (delete={delete}, dry_run={dry_run}).")
+        LOG_SYS.write(TAG, f"-- User Agent: {request.headers.get('user-agent')}.", level=DEBUG)
+        LOG_SYS.write(TAG, f"-- Connected with client (ip): {request.client.host}.", level=DEBUG)
+        return await sync_catalog(delete=delete, dry_run=dry_run)
+    except HTTPException as http_err:
+        LOG_SYS.write(TAG, f"An HTTP error occurred with Exception: {http_err.detail}")
+        raise http_err
+    except Exception as e:
+        LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 ###################################################################################################
 
 @app.get('/', status_code=200, tags=["root"], include_in_schema=False)
@@ -708,9 +1140,18 @@ if __name__ == '__main__':
 
     # Startup Message
     startup()
-    # Connect to MongoDB
-    connect(host="localhost", port=27017, db_name="WTFunko")
-    # Start Uvicorn App
-    uvicorn.run(app, host="localhost", port=8000)
+    if SERVER_WORKERS > ID_WORKERS:
+        LOG_SYS.write(STARTUP_TAG, f"At most {ID_WORKERS} worker processes can generate distinct ids, not {SERVER_WORKERS}.")
+        sys.exit(1)
+    if SERVER_WORKERS > 1:
+        # Every worker imports this module and connects in the lifespan, with the same token and settings
+        os.environ["ACCESS_TOKEN"] = ACCESS_TOKEN
+        LOG_SYS.write(STARTUP_TAG, f"Starting {SERVER_WORKERS} worker processes.")
+        uvicorn.run("app:app", host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS)
+    else:
+        # Connect to MongoDB
+        connect(host=MONGO_HOST, port=MONGO_PORT, db_name=MONGO_DB_NAME)
+        # Start Uvicorn App
+        uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
 
 ###################################################################################################
\ No newline at end of file
@@ -0,0 +1,76 @@
+# Benchmark - Async data layer
+# To Run (from the server directory, with a local mongod): python -m benchmarks.async_db
+
+import time
+import asyncio
+import argparse
+
+import mongo
+from utils.enumerations.criteria import Criteria, getCriteriaSorting
+
+###################################################################################################
+
+CATEGORIES = ["All", "Marvel", "Disney", "Pokemon", "Star Wars", "Harry Potter"]
+SEARCH_TERMS = ["", "pop", "shirt", "deluxe"]
+
+
+def page_query(category: str, searchTerm: str, criteria: Criteria, pageIndex: int) -> tuple:
+    # The same filter, sort, skip and limit for both drivers
+    filter = mongo.getCombinedFilter(category, searchTerm)
+    sort = getCriteriaSorting(criteria)
+    return filter, sort, pageIndex * mongo.AMOUNT_PRODUCT_PAGE, mongo.AMOUNT_PRODUCT_PAGE
+
+
+def blocking_get_products(category: str, searchTerm: str, criteria: Criteria, pageIndex: int):
+    # The previous data layer: a synchronous pymongo call executed inside the event loop
+    filter, sort, skip, limit = page_query(category, searchTerm, criteria, pageIndex)
+    return list(mongo.DATABASE["Products"].find(filter).sort(sort).skip(skip).limit(limit))
+
+
+async def async_get_products(category: str, searchTerm: str, criteria: Criteria, pageIndex: int):
+    # The Motor data layer, without the search index and the caches of get_products in between
+    filter, sort, skip, limit = page_query(category, searchTerm, criteria, pageIndex)
+    return await mongo.ASYNC_DATABASE["Products"].find(filter).sort(sort).skip(skip).limit(limit).to_list(length=None)
+
+
+async def run_level(concurrency: int, requests: int, blocking: bool, criteria: Criteria) -> float:
+    # Keep `concurrency` requests in flight until `requests` have completed
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(i: int):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        searchTerm = SEARCH_TERMS[i % len(SEARCH_TERMS)]
+        async with semaphore:
+            if blocking:
+                blocking_get_products(category, searchTerm, criteria, 0)
+            else:
+                await async_get_products(category, searchTerm, criteria, 0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed
+
+
+async def main(levels, requests: int, criteria: Criteria):
+    print(f"{'in-flight':>10} {'blocking req/s':>16} {'async req/s':>14}")
+    for concurrency in levels:
+        blocking_rps = await run_level(concurrency, requests, blocking=True, criteria=criteria)
+        async_rps = await run_level(concurrency, requests, blocking=False, criteria=criteria)
+        print(f"{concurrency:>10} {blocking_rps:>16.1f} {async_rps:>14.1f}")
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput of the data layer by number of in-flight requests.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--db-name", default="WTFunko")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--criteria", default=Criteria.DEFAULT.value, choices=[criteria.value for criteria in Criteria],
+                        help="Sorting of the product pages.")
+    args = parser.parse_args()
+
+    mongo.connect(host=args.host, port=args.port, db_name=args.db_name)
+    asyncio.run(main(args.levels, args.requests, Criteria(args.criteria)))
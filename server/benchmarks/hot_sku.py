@@ -0,0 +1,74 @@
+# Benchmark - Hot SKU checkout
+# To Run (from the server directory, with a local mongod): python -m benchmarks.hot_sku
+
+import time
+import asyncio
+import argparse
+
+from fastapi import HTTPException
+
+import mongo
+from models import Order, OrderProduct, UserInfo
+
+###################################################################################################
+
+HOT_SKU_ID = 1000000000001
+
+
+def build_order(amount: int) -> Order:
+    return Order(user=UserInfo(username="bench_hot_sku", email="bench_hot_sku@wtfunko.it"),
+                 products=[OrderProduct(_id=HOT_SKU_ID, title="Hot SKU", product_type="Pop!", price=15.0,
+                                        amount=amount, interest=["Benchmark"], img="")],
+                 total=15.0 * amount, date="2024-01-01", status="Shipped")
+
+
+async def main(stock: int, clients: int, orders: int):
+    products = mongo.ASYNC_DATABASE["Products"]
+    await products.replace_one({"_id": HOT_SKU_ID}, {"_id": HOT_SKU_ID, "title": "Hot SKU", "quantity": stock}, upsert=True)
+
+    accepted, rejected, conflicts = 0, 0, 0
+    semaphore = asyncio.Semaphore(clients)
+
+    async def checkout():
+        nonlocal accepted, rejected, conflicts
+        async with semaphore:
+            try:
+                await mongo.place_order(build_order(1))
+                accepted += 1
+            except HTTPException as http_err:
+                # 409: out of stock, 503: still conflicting after the transaction retries
+                if http_err.status_code == 409:
+                    rejected += 1
+                elif http_err.status_code == 503:
+                    conflicts += 1
+                else:
+                    raise
+
+    start = time.perf_counter()
+    await asyncio.gather(*(checkout() for _ in range(orders)))
+    elapsed = time.perf_counter() - start
+
+    remaining = (await products.find_one({"_id": HOT_SKU_ID}))["quantity"]
+    print(f"transactions: {await mongo.supports_transactions()}")
+    print(f"{orders} orders from {clients} clients in {elapsed:.2f}s ({orders / elapsed:.1f} orders/s)")
+    print(f"accepted: {accepted}, rejected: {rejected}, conflicts: {conflicts}, stock left: {remaining}")
+    print("OK, no overselling" if accepted + remaining == stock and remaining >= 0 else "FAILED, stock and orders disagree")
+
+    # Remove the benchmark data
+    await products.delete_one({"_id": HOT_SKU_ID})
+    await mongo.ASYNC_DATABASE["Orders"].delete_many({"user.username": "bench_hot_sku"})
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrent checkouts of a single product with limited stock.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--db-name", default="WTFunko")
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--orders", type=int, default=2000)
+    args = parser.parse_args()
+
+    mongo.connect(host=args.host, port=args.port, db_name=args.db_name)
+    asyncio.run(main(args.stock, args.clients, args.orders))
@@ -0,0 +1,90 @@
+# Benchmark - Dataset ingestion
+# To Run (from the server directory): python -m benchmarks.ingestion
+
+import os
+import re
+import time
+import json
+import string
+import argparse
+import tempfile
+from ast import literal_eval
+
+import orjson
+import pandas as pd
+
+from utils.utils import extract_funko_dataset
+
+###################################################################################################
+
+def legacy_extract_funko_dataset(filename: str, json_file: str):
+    # The previous row by row implementation (iterrows, six literal_eval and an indented json.dump)
+    df = pd.read_csv(filename)
+    data = {}
+    for index, row in df.iterrows():
+        values = row.iloc[:].to_dict()
+        cleantext = re.sub(re.compile('<.*?>'), '', values["description"])
+        values["description"] = ''.join(filter(lambda x: x in string.printable, cleantext))
+        for column in ["interest", "license", "tags", "form_factor", "feature", "related"]:
+            values[column] = literal_eval(values[column])
+        for attr_to_drop in ["created_at", "published_at", "updated_at", "gid", "handle"]:
+            values.pop(attr_to_drop, None)
+        data[f"funko_{row.iloc[0]}"] = values
+    with open(json_file, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent=4)
+    return len(data)
+
+
+def make_synthetic(filename: str, rows: int, directory: str) -> str:
+    # Repeat the bundled dataset with fresh uids up to the requested number of rows
+    df = pd.read_csv(filename)
+    copies = -(-rows // len(df))
+    synthetic = pd.concat([df] * copies, ignore_index=True).iloc[:rows]
+    synthetic[synthetic.columns[0]] = range(1, rows + 1)
+    synthetic_file = os.path.join(directory, "synthetic.csv")
+    synthetic.to_csv(synthetic_file, index=False)
+    return synthetic_file
+
+
+def timed(name: str, function, *args) -> int:
+    start = time.perf_counter()
+    rows = function(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>28} {rows:>9} rows {elapsed:>8.2f}s {rows / elapsed:>12.0f} rows/s")
+    return rows
+
+
+def main(dataset: str, synthetic_rows: int, workers: int, legacy: bool):
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "funko.json")
+        ndjson_output = os.path.join(directory, "funko.ndjson")
+
+        print(f"Bundled dataset: {dataset}")
+        if legacy:
+            timed("legacy (iterrows)", legacy_extract_funko_dataset, dataset, output)
+            with open(output, 'rb') as file:
+                legacy_data = orjson.loads(file.read())
+        timed("columnar, json", extract_funko_dataset, dataset, output)
+        timed("columnar, ndjson", extract_funko_dataset, dataset, ndjson_output, True)
+        timed(f"columnar, {workers} workers", extract_funko_dataset, dataset, output, False, workers)
+        if legacy:
+            with open(output, 'rb') as file:
+                assert orjson.loads(file.read()) == legacy_data, "The columnar output differs from the legacy one"
+
+        if synthetic_rows > 0:
+            print(f"Synthetic dataset: {synthetic_rows} rows")
+            synthetic_file = make_synthetic(dataset, synthetic_rows, directory)
+            timed("columnar, ndjson", extract_funko_dataset, synthetic_file, ndjson_output, True)
+            timed(f"columnar, {workers} workers", extract_funko_dataset, synthetic_file, ndjson_output, True, workers)
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rows per second of the dataset extraction.")
+    parser.add_argument("--dataset", default="../source/data.csv")
+    parser.add_argument("--synthetic-rows", type=int, default=1000000, help="0 to skip the synthetic dataset.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-legacy", dest="legacy", action="store_false", help="Skip the previous implementation.")
+    args = parser.parse_args()
+
+    main(args.dataset, args.synthetic_rows, args.workers, args.legacy)
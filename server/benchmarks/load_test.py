@@ -0,0 +1,276 @@
+# Benchmark - Load test
+# To Run (from the server directory): python -m benchmarks.load_test
+# Boots a local mongod (seeded from source/json by the server startup) and the API, replays a mix of
+# requests and saves the results in benchmarks/results to compare runs across commits (--compare).
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime as dt
+
+import httpx
+
+###################################################################################################
+
+DEFAULT_MIX = "browse=50,search=20,product=20,login=5,order=5"
+CRITERIA = ["Default", "Price Ascending", "Price Descending", "Title Ascending", "Title Descending"]
+BENCH_USER = {"username": "bench_load", "email": "bench_load@wtfunko.it", "password": "bench_password"}
+PAGE_SIZE = 20
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+def wait_until(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Timed out waiting for {what}.")
+
+###################################################################################################
+
+class Catalog(object):
+    # Request parameters drawn from the dataset the database is seeded with
+
+    def __init__(self, dataset: str):
+        with open(dataset, 'r') as file:
+            self.products = list(json.load(file).values())
+        self.pages = {"All": -(-len(self.products) // PAGE_SIZE)}
+        words = set()
+        for product in self.products:
+            for interest in product["interest"]:
+                self.pages[interest] = self.pages.get(interest, 0) + 1
+            words.update(word.lower() for word in product["title"].split() if word.isalpha() and len(word) > 3)
+        for category, count in self.pages.items():
+            if category != "All":
+                self.pages[category] = -(-count // PAGE_SIZE)
+        self.categories = sorted(self.pages)
+        self.words = sorted(words)
+
+
+def make_request(scenario: str, catalog: Catalog, rng: random.Random) -> tuple:
+    # Method, url and keyword arguments of one request of the scenario
+    if scenario == "browse":
+        category = rng.choice(catalog.categories)
+        page = rng.randrange(min(catalog.pages[category], 5))
+        return "GET", "/getProducts", {"params": {"category": category, "searchTerm": "",
+                                                  "sortingCriteria": rng.choice(CRITERIA), "pageIndex": page}}
+    if scenario == "search":
+        return "GET", "/getProducts", {"params": {"category": "All", "searchTerm": rng.choice(catalog.words),
+                                                  "sortingCriteria": "Default", "pageIndex": 0}}
+    if scenario == "product":
+        return "GET", f"/getByID/{rng.choice(catalog.products)['_id']}", {}
+    if scenario == "login":
+        return "POST", "/login", {"json": BENCH_USER}
+    if scenario == "order":
+        product = rng.choice(catalog.products)
+        order_product = {field: product[field] for field in ("_id", "title", "product_type", "price", "interest", "img")}
+        order_product["amount"] = 1
+        return "POST", "/insertOrder", {"json": {
+            "user": {"username": BENCH_USER["username"], "email": BENCH_USER["email"]},
+            "products": [order_product],
+            "total": product["price"],
+            "date": dt.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "Pending"
+        }}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def worker(client: httpx.AsyncClient, catalog: Catalog, mix: dict, rng: random.Random,
+                 deadline: float, results: dict, record: bool):
+    scenarios, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        scenario = rng.choices(scenarios, weights)[0]
+        method, url, kwargs = make_request(scenario, catalog, rng)
+        start = time.perf_counter()
+        try:
+            status = (await client.request(method, url, **kwargs)).status_code
+        except httpx.HTTPError:
+            status = 0
+        if record:
+            result = results[scenario]
+            result["latencies"].append(time.perf_counter() - start)
+            result["statuses"][status] = result["statuses"].get(status, 0) + 1
+
+
+async def run_load(url: str, catalog: Catalog, mix: dict, concurrency: int, duration: float,
+                   warmup: float, seed: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        # The benchmark account (400 when it is already there)
+        await client.post("/signup", json=BENCH_USER)
+
+        results = {scenario: {"latencies": [], "statuses": {}} for scenario in mix}
+        for record, length in ((False, warmup), (True, duration)):
+            deadline = time.perf_counter() + length
+            await asyncio.gather(*(worker(client, catalog, mix, random.Random(seed * 1000 + i), deadline, results, record)
+                                   for i in range(concurrency)))
+    return results
+
+
+def summarize(results: dict, duration: float) -> dict:
+    def summary(latencies: list, statuses: dict) -> dict:
+        ordered = sorted(latencies)
+        requests = len(ordered)
+        errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+        rejected = sum(count for status, count in statuses.items() if 400 <= status < 500)
+        return {
+            "requests": requests,
+            "throughput": round(requests / duration, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "rejected_rate": round(rejected / requests, 4) if requests else 0.0,
+            "statuses": {str(status): count for status, count in sorted(statuses.items())}
+        }
+
+    scenarios = {scenario: summary(result["latencies"], result["statuses"]) for scenario, result in results.items()}
+    statuses = {}
+    for result in results.values():
+        for status, count in result["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + count
+    total = summary([latency for result in results.values() for latency in result["latencies"]], statuses)
+    return {"total": total, "scenarios": scenarios}
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"{'scenario':>10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}"
+          + (f" {'req/s vs baseline':>18}" if baseline else ""))
+    rows = [("total", report["total"])] + sorted(report["scenarios"].items())
+    for name, summary in rows:
+        line = (f"{name:>10} {summary['throughput']:>9.1f} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+                f"{summary['p99_ms']:>9.2f} {summary['error_rate'] * 100:>7.2f}%")
+        if baseline:
+            previous = baseline["total"] if name == "total" else baseline["scenarios"].get(name)
+            if previous and previous["throughput"]:
+                line += f" {(summary['throughput'] / previous['throughput'] - 1) * 100:>+17.1f}%"
+        print(line)
+
+###################################################################################################
+
+def start_mongod(mongod: str, directory: str) -> tuple:
+    port = free_port()
+    dbpath = os.path.join(directory, "db")
+    os.makedirs(dbpath)
+    process = subprocess.Popen([mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until(lambda: socket.create_connection(("127.0.0.1", port), timeout=1).close() is None, 30, "mongod")
+    return process, port
+
+
+def start_server(mongo_host: str, mongo_port: int, db_name: str) -> tuple:
+    # The same startup as app.py (population, indexes, search index) on free ports
+    port = free_port()
+    bootstrap = ("import uvicorn, app, mongo; "
+                 f"mongo.connect(host={mongo_host!r}, port={mongo_port}, db_name={db_name!r}); "
+                 f"uvicorn.run(app.app, host='127.0.0.1', port={port}, log_level='warning')")
+    server_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, "-c", bootstrap], cwd=server_directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    wait_until(lambda: httpx.get(url + "/openapi.json", timeout=1).status_code == 200, 120, "the API server")
+    return process, url
+
+
+def stop(process: subprocess.Popen):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(args):
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    catalog = Catalog(args.dataset)
+    directory = tempfile.mkdtemp(prefix="wtfunko_load_")
+    mongod_process, server_process = None, None
+    try:
+        if args.url is None:
+            if args.mongo_host is None:
+                if shutil.which(args.mongod) is None:
+                    raise SystemExit(f"mongod not found ({args.mongod}): install it or pass --mongo-host/--url.")
+                mongod_process, mongo_port = start_mongod(args.mongod, directory)
+                mongo_host = "127.0.0.1"
+            else:
+                mongo_host, mongo_port = args.mongo_host, args.mongo_port
+            server_process, url = start_server(mongo_host, mongo_port, args.db_name)
+        else:
+            url = args.url
+
+        results = asyncio.run(run_load(url, catalog, mix, args.concurrency, args.duration, args.warmup, args.seed))
+    finally:
+        stop(server_process)
+        stop(mongod_process)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "date": dt.now().isoformat(timespec="seconds"),
+        "config": {"mix": mix, "concurrency": args.concurrency, "duration": args.duration,
+                   "warmup": args.warmup, "seed": args.seed, "cpus": os.cpu_count()},
+        **summarize(results, args.duration)
+    }
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                         f"load_{report['commit']}_{dt.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results saved in {output}")
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput, latency percentiles and error rates of a realistic request mix.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weights of the scenarios (default {DEFAULT_MIX}).")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds.")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the request parameters.")
+    parser.add_argument("--dataset", default="../source/json/products.json")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary booted on a temporary database.")
+    parser.add_argument("--mongo-host", default=None, help="Use a running MongoDB instead of booting mongod.")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--db-name", default="WTFunkoLoadTest")
+    parser.add_argument("--url", default=None, help="Use a running API server instead of booting one.")
+    parser.add_argument("--output", default=None, help="JSON results file (default benchmarks/results/load_<commit>_<date>.json).")
+    parser.add_argument("--compare", default=None, help="JSON results of a previous run to compare with.")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,68 @@
+# Benchmark - Login storm
+# To Run (from the server directory, with the server started): python -m benchmarks.login_storm
+
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+###################################################################################################
+
+BENCH_USER = {"username": "bench_login", "email": "bench_login@wtfunko.it", "password": "bench_password"}
+PRODUCTS_QUERY = {"category": "All", "searchTerm": "", "sortingCriteria": "Default", "pageIndex": 0}
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def login_worker(client: httpx.AsyncClient, deadline: float, latencies: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.post("/login", json=BENCH_USER)
+        latencies.append(time.perf_counter() - start)
+
+
+async def products_worker(client: httpx.AsyncClient, deadline: float, latencies: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get("/getProducts", params=PRODUCTS_QUERY)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url: str, logins: int, browsers: int, duration: float):
+    limits = httpx.Limits(max_connections=logins + browsers)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        # Make sure the benchmark account exists (400 when it is already there)
+        await client.post("/signup", json=BENCH_USER)
+
+        # Baseline latency of /getProducts without any login in flight
+        baseline = []
+        await products_worker(client, time.perf_counter() + min(duration, 5), baseline)
+
+        login_latencies, products_latencies = [], []
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(login_worker(client, deadline, login_latencies) for _ in range(logins)),
+            *(products_worker(client, deadline, products_latencies) for _ in range(browsers)))
+
+    print(f"logins/s: {len(login_latencies) / duration:.1f} "
+          f"(p50 {statistics.median(login_latencies) * 1000:.1f}ms, p99 {percentile(login_latencies, 0.99) * 1000:.1f}ms)")
+    print(f"/getProducts idle: p50 {statistics.median(baseline) * 1000:.1f}ms, p99 {percentile(baseline, 0.99) * 1000:.1f}ms")
+    print(f"/getProducts under storm: p50 {statistics.median(products_latencies) * 1000:.1f}ms, "
+          f"p99 {percentile(products_latencies, 0.99) * 1000:.1f}ms")
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Login throughput and latency of unrelated requests during a login storm.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=32, help="Concurrent clients logging in.")
+    parser.add_argument("--browsers", type=int, default=4, help="Concurrent clients browsing /getProducts.")
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.logins, args.browsers, args.duration))
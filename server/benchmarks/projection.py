@@ -0,0 +1,107 @@
+# Benchmark - Product card projection
+# To Run (from the server directory): python -m benchmarks.projection
+# Payload size and serialization time of a listing page with the whole products and with fields=card.
+# With --url the pages are also requested from a running server (python -m benchmarks.projection --url http://localhost:8000).
+
+import gzip
+import time
+import json
+import argparse
+from typing import List
+
+import httpx
+from pydantic import TypeAdapter
+from fastapi.responses import ORJSONResponse
+
+from models import Product, ProductCard, PRODUCT_PROJECTION, PRODUCT_CARD_FIELDS
+
+###################################################################################################
+
+ADAPTERS = {"full": TypeAdapter(List[Product]), "card": TypeAdapter(List[ProductCard])}
+
+
+def encoded_page(page: list) -> bytes:
+    # The default path: projected documents encoded straight to JSON
+    return ORJSONResponse(page).body
+
+
+def validated_page(page: list, projection: str) -> bytes:
+    # The VALIDATE_RESPONSES path: models, then response validation and encoding
+    adapter = ADAPTERS[projection]
+    return adapter.dump_json(adapter.validate_python(page), by_alias=True)
+
+
+def cpu_per_page(function, pages: list, repeat: int, *args) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        for page in pages:
+            function(page, *args)
+    return (time.process_time() - start) / (repeat * len(pages))
+
+
+def measure_server(url: str, pages: int, repeat: int):
+    # Bytes of the JSON and on the wire (gzip) and latency of /getProducts, whole products against the cards
+    print(f"\n{'server':>8} {'bytes':>10} {'wire bytes':>11} {'mean ms':>9}")
+    rows = {}
+    with httpx.Client(base_url=url, timeout=60) as client:
+        for projection, fields in (("full", None), ("card", "card")):
+            sizes, compressed, elapsed = [], [], []
+            for _ in range(repeat):
+                for page_index in range(pages):
+                    params = {"category": "All", "searchTerm": "", "sortingCriteria": "Default", "pageIndex": page_index}
+                    if fields is not None:
+                        params["fields"] = fields
+                    start = time.perf_counter()
+                    response = client.get("/getProducts", params=params, headers={"Accept-Encoding": "gzip"})
+                    elapsed.append(time.perf_counter() - start)
+                    response.raise_for_status()
+                    sizes.append(len(response.content))
+                    compressed.append(response.num_bytes_downloaded)
+            rows[projection] = (sum(sizes) / len(sizes), sum(compressed) / len(compressed), sum(elapsed) / len(elapsed))
+            size, gzip_size, mean = rows[projection]
+            print(f"{projection:>8} {size:>10.0f} {gzip_size:>11.0f} {mean * 1000:>9.2f}")
+    print(f"{'ratio':>8} {rows['full'][0] / rows['card'][0]:>9.1f}x {rows['full'][1] / rows['card'][1]:>10.1f}x "
+          f"{rows['full'][2] / rows['card'][2]:>8.1f}x")
+
+
+def main(args):
+    with open(args.dataset, 'r') as file:
+        # Documents as the projections return them (related ids as integers, only the requested fields)
+        full = [{field: product.get(field) for field in PRODUCT_PROJECTION} for product in json.load(file).values()]
+        for product in full:
+            product["related"] = [int(related_id) for related_id in product["related"]]
+    card = [{field: product[field] for field in PRODUCT_CARD_FIELDS} for product in full]
+
+    size = args.page_size
+    pages = {"full": [full[i:i + size] for i in range(0, len(full), size)],
+             "card": [card[i:i + size] for i in range(0, len(card), size)]}
+
+    print(f"{len(full)} products, pages of {size}")
+    print(f"{'page':>8} {'bytes':>10} {'gzip bytes':>11} {'encode ms':>10} {'validated ms':>13}")
+    results = {}
+    for projection, projection_pages in pages.items():
+        raw = sum(len(encoded_page(page)) for page in projection_pages) / len(projection_pages)
+        compressed = sum(len(gzip.compress(encoded_page(page))) for page in projection_pages) / len(projection_pages)
+        encode = cpu_per_page(encoded_page, projection_pages, args.repeat)
+        validated = cpu_per_page(validated_page, projection_pages, args.repeat, projection)
+        results[projection] = (raw, compressed, encode, validated)
+        print(f"{projection:>8} {raw:>10.0f} {compressed:>11.0f} {encode * 1000:>10.4f} {validated * 1000:>13.4f}")
+    print(f"{'ratio':>8} " + " ".join(f"{results['full'][i] / results['card'][i]:>{width - 1}.1f}x"
+                                      for i, width in enumerate((10, 11, 10, 13))))
+
+    if args.url is not None:
+        measure_server(args.url, args.server_pages, args.server_repeat)
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Payload size and serialization time of the product cards against the whole products.")
+    parser.add_argument("--dataset", default="../source/json/products.json")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--url", default=None, help="Also measure the pages served by a running API server.")
+    parser.add_argument("--server-pages", type=int, default=10, help="Pages requested from the server.")
+    parser.add_argument("--server-repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,55 @@
+# Benchmark - Search index
+# To Run (from the server directory): python -m benchmarks.search_index
+
+import re
+import time
+import json
+import argparse
+
+from utils.search import SearchIndex
+
+###################################################################################################
+
+QUERIES = ["pop", "marvel", "spider", "star wars", "harry potter", "deluxe", "shirt", "chase", "funko", "zzz"]
+
+
+def regex_search(products: list, searchTerm: str) -> list:
+    # The same unanchored case-insensitive $regex over title, description and product_type,
+    # evaluated like a collection scan
+    pattern = re.compile(searchTerm, re.IGNORECASE)
+    return [product["_id"] for product in products
+            if pattern.search(product["title"]) or pattern.search(product["description"])
+            or pattern.search(product["product_type"])]
+
+
+def timed(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(dataset: str, repeat: int):
+    with open(dataset, 'r') as file:
+        products = list(json.load(file).values())
+
+    index = SearchIndex()
+    build_time = timed(lambda: index.build(products), 1)
+    print(f"Indexed {len(products)} products in {build_time * 1000:.1f}ms")
+
+    print(f"{'query':>14} {'regex ms':>10} {'index ms':>10} {'speedup':>8} {'regex hits':>11} {'index hits':>11}")
+    for query in QUERIES:
+        regex_time = timed(lambda: regex_search(products, query), repeat)
+        index_time = timed(lambda: index.search(query), repeat)
+        print(f"{query:>14} {regex_time * 1000:>10.3f} {index_time * 1000:>10.3f} {regex_time / index_time:>7.1f}x "
+              f"{len(regex_search(products, query)):>11} {len(index.search(query)):>11}")
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search index against the regex scan on the products dataset.")
+    parser.add_argument("--dataset", default="../source/json/products.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    main(args.dataset, args.repeat)
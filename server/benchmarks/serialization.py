@@ -0,0 +1,62 @@
+# Benchmark - Response serialization
+# To Run (from the server directory): python -m benchmarks.serialization
+
+import time
+import json
+import argparse
+from typing import List
+
+from pydantic import TypeAdapter
+from fastapi.responses import ORJSONResponse
+
+from models import Product, PRODUCT_PROJECTION
+
+###################################################################################################
+
+PRODUCTS_ADAPTER = TypeAdapter(List[Product])
+
+
+def validated_response(product_data: list) -> bytes:
+    # The previous path: Product models in mongo.py, then response_model validation and json encoding in FastAPI
+    products = [Product(**product) for product in product_data]
+    content = PRODUCTS_ADAPTER.dump_python(PRODUCTS_ADAPTER.validate_python(products), mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def direct_response(product_data: list) -> bytes:
+    # The fast path: projected documents encoded straight to JSON bytes
+    return ORJSONResponse(product_data).body
+
+
+def cpu_per_request(function, product_data: list, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        function(product_data)
+    return (time.process_time() - start) / repeat
+
+
+def main(dataset: str, repeat: int, page_size: int):
+    with open(dataset, 'r') as file:
+        # Documents as the projection returns them (related ids as integers, only the model fields)
+        product_data = [{field: product.get(field) for field in PRODUCT_PROJECTION} for product in json.load(file).values()]
+        for product in product_data:
+            product["related"] = [int(related_id) for related_id in product["related"]]
+
+    cases = {"/getAllProducts": product_data, "/getProducts": product_data[:page_size]}
+    print(f"{'endpoint':>16} {'before ms':>10} {'after ms':>10} {'speedup':>8} {'bytes':>10}")
+    for endpoint, data in cases.items():
+        before = cpu_per_request(validated_response, data, repeat)
+        after = cpu_per_request(direct_response, data, repeat)
+        assert json.loads(validated_response(data)) == json.loads(direct_response(data))
+        print(f"{endpoint:>16} {before * 1000:>10.3f} {after * 1000:>10.3f} {before / after:>7.1f}x {len(direct_response(data)):>10}")
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CPU time per request of the validated and the direct JSON responses.")
+    parser.add_argument("--dataset", default="../source/json/products.json")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.dataset, args.repeat, args.page_size)
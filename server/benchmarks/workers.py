@@ -0,0 +1,127 @@
+# Benchmark - Worker processes scaling
+# To Run (from the server directory): python -m benchmarks.workers --workers 1,2,4
+# Boots a local mongod and, for every worker count, the server in multi-worker mode (app.py with
+# SERVER_WORKERS), then measures the requests/sec of /getProducts and /getByID against the single worker.
+
+import os
+import sys
+import json
+import signal
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime as dt
+
+import httpx
+
+from benchmarks.load_test import Catalog, run_load, summarize, free_port, git_commit, wait_until, start_mongod, stop
+
+###################################################################################################
+
+DEFAULT_MIX = "browse=50,product=50"
+
+
+def start_workers(workers: int, mongo_host: str, mongo_port: int, db_name: str) -> tuple:
+    # The server of app.py in its own process group, to stop the workers with it
+    port = free_port()
+    env = dict(os.environ, SERVER_HOST="127.0.0.1", SERVER_PORT=str(port), SERVER_WORKERS=str(workers),
+               MONGO_HOST=mongo_host, MONGO_PORT=str(mongo_port), MONGO_DB_NAME=db_name)
+    server_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=server_directory, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    wait_until(lambda: httpx.get(url + "/openapi.json", timeout=1).status_code == 200, 180, "the API server")
+    return process, url
+
+
+def stop_workers(process: subprocess.Popen):
+    if process is None or process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def print_report(runs: list):
+    print(f"{'workers':>8} {'req/s':>9} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>8}"
+          f" {'getProducts req/s':>18} {'getByID req/s':>14}")
+    single = runs[0]["total"]["throughput"] if runs and runs[0]["workers"] == 1 else None
+    for run in runs:
+        total = run["total"]
+        speedup = f"{total['throughput'] / single:.2f}x" if single else "-"
+        print(f"{run['workers']:>8} {total['throughput']:>9.1f} {speedup:>8} {total['p50_ms']:>9.2f} "
+              f"{total['p99_ms']:>9.2f} {total['error_rate'] * 100:>7.2f}% "
+              f"{run['scenarios'].get('browse', {}).get('throughput', 0.0):>18.1f} "
+              f"{run['scenarios'].get('product', {}).get('throughput', 0.0):>14.1f}")
+
+
+def main(args):
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    counts = [int(count) for count in args.workers.split(",")]
+    catalog = Catalog(args.dataset)
+    directory = tempfile.mkdtemp(prefix="wtfunko_workers_")
+    mongod_process = None
+    runs = []
+    try:
+        if args.mongo_host is None:
+            if shutil.which(args.mongod) is None:
+                raise SystemExit(f"mongod not found ({args.mongod}): install it or pass --mongo-host.")
+            mongod_process, mongo_port = start_mongod(args.mongod, directory)
+            mongo_host = "127.0.0.1"
+        else:
+            mongo_host, mongo_port = args.mongo_host, args.mongo_port
+
+        for workers in counts:
+            server_process = None
+            try:
+                server_process, url = start_workers(workers, mongo_host, mongo_port, args.db_name)
+                results = asyncio.run(run_load(url, catalog, mix, args.concurrency, args.duration, args.warmup, args.seed))
+            finally:
+                stop_workers(server_process)
+            runs.append({"workers": workers, **summarize(results, args.duration)})
+            print(f"{workers} workers: {runs[-1]['total']['throughput']:.1f} req/s")
+    finally:
+        stop(mongod_process)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print_report(runs)
+    report = {
+        "commit": git_commit(),
+        "date": dt.now().isoformat(timespec="seconds"),
+        "config": {"mix": mix, "concurrency": args.concurrency, "duration": args.duration,
+                   "warmup": args.warmup, "seed": args.seed, "cpus": os.cpu_count()},
+        "runs": runs
+    }
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                                         f"workers_{report['commit']}_{dt.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results saved in {output}")
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Requests/sec of /getProducts and /getByID by number of worker processes.")
+    parser.add_argument("--workers", default=",".join(str(count) for count in (1, 2, 4, 8) if count <= (os.cpu_count() or 1)),
+                        help="Worker counts to measure, comma separated (default 1,2,4,8 up to the cores).")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weights of the scenarios (default {DEFAULT_MIX}).")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds for every worker count.")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the request parameters.")
+    parser.add_argument("--dataset", default="../source/json/products.json")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary booted on a temporary database.")
+    parser.add_argument("--mongo-host", default=None, help="Use a running MongoDB instead of booting mongod.")
+    parser.add_argument("--mongo-port", type=int, default=27017)
+    parser.add_argument("--db-name", default="WTFunkoWorkersTest")
+    parser.add_argument("--output", default=None, help="JSON results file (default benchmarks/results/workers_<commit>_<date>.json).")
+    args = parser.parse_args()
+
+    main(args)
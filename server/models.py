@@ -2,6 +2,8 @@
 from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel, Field
 
+from utils.enumerations.bulk import BulkOperationType
+
 class User(BaseModel):
     id: Optional[Union[int, str]] = Field(-1, alias='_id', description="Unique identifier for the user")
     username: str = Field(..., description="Username of the user")
@@ -31,12 +33,31 @@ class Product(BaseModel):
     img: str = Field(..., description="Image URL of the product")
 
 
+# Projection of the stored products on the Product fields, with the related ids (stored as strings) as integers
+PRODUCT_PROJECTION = {
+    **{(field.alias or name): 1 for name, field in Product.model_fields.items()},
+    "related": {"$map": {"input": "$related", "as": "related_id", "in": {"$toLong": "$$related_id"}}}
+}
+
+
+class ProductCard(BaseModel):
+    id: Optional[Optional[Union[int, str]]] = Field(-1, alias='_id', description="Unique identifier for the product")
+    title: str = Field(..., description="Title of the product")
+    price: float = Field(..., description="Price of the product")
+    img: str = Field(..., description="Image URL of the product")
+    interest: List[str] = Field(..., description="List of interests associated with the product")
+
+
+# Fields of the product cards of the listings (fields=card)
+PRODUCT_CARD_FIELDS = tuple((field.alias or name) for name, field in ProductCard.model_fields.items())
+
+
 class OrderProduct(BaseModel):
     id: Optional[Optional[Union[int, str]]] = Field(-1, alias='_id', description="Unique identifier for the product")
     title: str = Field(..., description="Title of the product")
     product_type: str = Field(..., description="Type of the product")
     price: float = Field(..., description="Price of the product")
-    amount: int = Field(..., description="Amount of product purchased")
+    amount: int = Field(..., ge=1, description="Amount of product purchased")
     interest: List[str] = Field(..., description="List of interests associated with the product")
     img: str = Field(..., description="Image URL of the product")
 
@@ -48,3 +69,9 @@ class Order(BaseModel):
     total: float = Field(..., description="Total price of the order")
     date: str = Field(..., description="Date of the order")
     status: str = Field(..., description="Status of the order")
+
+
+class BulkOperation(BaseModel):
+    op: BulkOperationType = Field(..., description="Operation to apply: insert, update or delete")
+    key: Optional[Union[int, str]] = Field(None, description="Identifier of the document to update or delete (the _id, or the username for the users)")
+    data: Optional[Dict[str, Any]] = Field(None, description="Document to insert, or fields to update")
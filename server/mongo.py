@@ -1,25 +1,55 @@
 # MongoDB
 from fastapi import HTTPException
+from pymongo import InsertOne, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from pydantic import ValidationError
+from typing import Tuple
+from pymongo import ReturnDocument
 import pymongo
+import contextlib
+import datetime
+import socket
+import itertools
+import hashlib
+import asyncio
+import orjson
+import base64
+import json
 import math
+import random
+import time
+import os
 
 from mongo import *
 from models import *
 from utils.utils import *
 from utils.enumerations.criteria import *
+from utils.enumerations.bulk import BulkOperationType, getBulkStatusCode
 
-from utils.logger import get_logger
-from utils.database import get_database
+from utils.logger import get_logger, WARNING, ERROR
+from utils.indexes import INDEXES, reconcile_indexes, explain_query_shapes, unused_indexes
+from utils.database import get_database, get_async_database, get_collection, MONGO_MIN_POOL_SIZE
+from utils.search import SearchIndex, get_search_index, INDEX_FIELDS, FACET_FIELDS
+from utils.related import RelatedGraph, get_related_graph, RELATED_FIELDS
+from utils.cache import LRUCache
+from utils.ids import generate_id, set_id_worker, ID_WORKERS, IdWorkerError
+from utils.profiler import get_query_profiler, profiled
 
 LOG_SYS = get_logger()
+SEARCH_INDEX = get_search_index()
+RELATED_GRAPH = get_related_graph()
+PROFILER = get_query_profiler()
 DATABASE = None
+ASYNC_DATABASE = None
+TRANSACTIONS = None
 
 TAG = "MongoDB"
 
 ###################################################################################################
 
-def connect(host="localhost", port=27017, db_name=None, username=None, password=None):
+def connect(host="localhost", port=27017, db_name=None, username=None, password=None, populate=True):
     global DATABASE
+    global ASYNC_DATABASE
 
     if username is None or password is None:
         URI = f"mongodb://{host}:{port}/{db_name}"
@@ -28,76 +58,359 @@ def connect(host="localhost", port=27017, db_name=None, username=None, password=
     try:
         LOG_SYS.write(TAG, "Connection to MongoDB.")
         DATABASE = get_database(URI, db_name)
-        LOG_SYS.write(TAG, "Population of the database.")
-        populate_database()
+        ASYNC_DATABASE = get_async_database(URI, db_name, [PROFILER.listener] if PROFILER.enabled else None)
+        PROFILER.database = ASYNC_DATABASE
+        if not populate:
+            return
+        claim_id_worker()
+        # With more server processes only one populates and creates the indexes, the others find them done
+        with startup_lock():
+            LOG_SYS.write(TAG, "Population of the database.")
+            populate_database()
+            LOG_SYS.write(TAG, "Reconciliation of the indexes.")
+            ensure_indexes()
+        LOG_SYS.write(TAG, "Building of the products search index.")
+        build_search_index()
     except Exception as e:
         LOG_SYS.write(TAG, f"Error connecting to MongoDB: {e}")
+        if isinstance(e, IdWorkerError):
+            raise
 
 
-def create_product_indices(products: pymongo.collection.Collection):
-    products.create_index([("interest", 1)])
-    products.create_index([("product_type", 1)])
-    products.create_index([("title", 1)])
-    products.create_index([("price", 1)])
+def is_connected() -> bool:
+    return ASYNC_DATABASE is not None
+
+
+# Startup lock settings (override with environment variables)
+STARTUP_LOCK_TTL = float(os.environ.get("STARTUP_LOCK_TTL", 600))
+STARTUP_LOCK_POLL = 0.5
+
+# Server worker processes (see app.py) and lease of the id worker number of this process
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 1))
+ID_WORKER_LEASE_TTL = float(os.environ.get("ID_WORKER_LEASE_TTL", 60))
+ID_WORKER_SLOT = None
+
+# Identity of this server process in the locks and in the catalog changes
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{generate_unique_id(length=8, alphanumeric=True)}"
+
+
+def acquire_lock(name: str, ttl: float) -> bool:
+    # A lock document owned until it expires: the upsert fails on the _id while another process holds it
+    now = time.time()
+    try:
+        DATABASE["Locks"].update_one({"_id": name, "$or": [{"expires": {"$lt": now}}, {"owner": PROCESS_ID}]},
+                                     {"$set": {"owner": PROCESS_ID, "expires": now + ttl}}, upsert=True)
+        return True
+    except pymongo.errors.DuplicateKeyError:
+        return False
+
+
+def release_lock(name: str):
+    DATABASE["Locks"].delete_one({"_id": name, "owner": PROCESS_ID})
+
+
+@contextlib.contextmanager
+def startup_lock(name: str = "startup"):
+    waited = False
+    while not acquire_lock(name, STARTUP_LOCK_TTL):
+        if not waited:
+            LOG_SYS.write(TAG, "Waiting for another server process to complete the startup.")
+            waited = True
+        time.sleep(STARTUP_LOCK_POLL)
+    try:
+        yield
+    finally:
+        release_lock(name)
+
+
+def claim_id_worker():
+    # A distinct id worker number for every server process: a free slot leased in the Locks collection and
+    # renewed by keep_id_worker. ID_WORKER is used as it is only by a single server process.
+    global ID_WORKER_SLOT
+
+    if "ID_WORKER" in os.environ and SERVER_WORKERS <= 1:
+        set_id_worker(int(os.environ["ID_WORKER"]))
+        return
+    for worker in range(ID_WORKERS):
+        if acquire_lock(f"id_worker:{worker}", ID_WORKER_LEASE_TTL):
+            ID_WORKER_SLOT = worker
+            set_id_worker(worker)
+            LOG_SYS.write(TAG, f"Generating ids as worker {worker}.")
+            return
+    raise IdWorkerError(f"No free id worker: at most {ID_WORKERS} server processes can share the database.")
+
+
+async def keep_id_worker():
+    # Renew the lease of the id worker until cancelled, then release it
+    if ID_WORKER_SLOT is None:
+        return
+    name = f"id_worker:{ID_WORKER_SLOT}"
+    try:
+        while True:
+            await asyncio.sleep(ID_WORKER_LEASE_TTL / 3)
+            try:
+                await asyncio.to_thread(acquire_lock, name, ID_WORKER_LEASE_TTL)
+            except Exception as e:
+                LOG_SYS.write(TAG, f"Renewal of the id worker lease failed: {e}", level=WARNING)
+    finally:
+        await asyncio.to_thread(release_lock, name)
+
+
+async def prewarm_connections(connections: int = MONGO_MIN_POOL_SIZE) -> int:
+    # Open the connections of the async pool before the first requests (concurrent pings check out one each)
+    if ASYNC_DATABASE is None:
+        return 0
+    start = time.perf_counter()
+    try:
+        await supports_transactions()
+        await asyncio.gather(*(ASYNC_DATABASE.command("ping") for _ in range(max(connections, 1))))
+    except Exception as e:
+        LOG_SYS.write(TAG, f"Prewarm of the connection pool failed: {e}", level=WARNING)
+        return 0
+    LOG_SYS.write(TAG, f"Prewarmed {connections} connections in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return connections
+
+
+def ensure_indexes():
+    # Reconcile the indexes with the declared ones and report the query shapes not served by an index
+    report = reconcile_indexes(DATABASE)
+    for name in report["created"]:
+        LOG_SYS.write(TAG, f"Created index {name}.")
+    for name in report["dropped"]:
+        LOG_SYS.write(TAG, f"Dropped undeclared or changed index {name}.", level=WARNING)
+    for failure in report["failed"]:
+        LOG_SYS.write(TAG, f"Creation of index {failure} failed.", level=ERROR)
+    try:
+        for result in explain_query_shapes(DATABASE):
+            if result["missing_index"]:
+                LOG_SYS.write(TAG, f"Query {result['query']} on {result['collection']} is not served by an index "
+                                   f"(plan: {' <- '.join(result['stages'])}).", level=WARNING)
+    except Exception as e:
+        LOG_SYS.write(TAG, f"Explain of the query shapes failed: {e}", level=WARNING)
+
+
+def get_index_report() -> dict:
+    # Indexes of the collections, explain() of the query shapes and the unused indexes
+    return {
+        "indexes": {collection_name: [index["name"] for index in DATABASE[collection_name].list_indexes()]
+                    for collection_name in INDEXES},
+        "queries": explain_query_shapes(DATABASE),
+        "unused": unused_indexes(DATABASE)
+    }
+
+
+# Product fields of the in-memory catalog structures (search index and related graph)
+CATALOG_FIELDS = INDEX_FIELDS | RELATED_FIELDS
+
+
+def prepare_search_index() -> tuple:
+    # Catalog version, search index and related graph of the products, built aside from the ones being served
+    counter = DATABASE["Counters"].find_one({"_id": "catalog"})
+    version = counter["value"] if counter is not None else 0
+    products = DATABASE["Products"]
+    catalog = list(products.find({}, {field: 1 for field in CATALOG_FIELDS}))
+    return version, SearchIndex.prepare(catalog), RelatedGraph.prepare(catalog)
+
+
+def install_search_index(version: int, search_index, related_graph):
+    global CATALOG_VERSION
+
+    # The changes published from now on are replayed on the new structures
+    CATALOG_VERSION = version
+    SEARCH_INDEX.replace(search_index)
+    LOG_SYS.write(TAG, f"Indexed {SEARCH_INDEX.count('')} products for full-text search.")
+    RELATED_GRAPH.replace(related_graph)
+    LOG_SYS.write(TAG, f"Built the related products graph ({RELATED_GRAPH.dangling()} dangling references skipped).")
+
+
+def build_search_index():
+    install_search_index(*prepare_search_index())
+
+
+def index_product(product_data: dict):
+    SEARCH_INDEX.add(product_data)
+    RELATED_GRAPH.add(product_data)
+
+
+def unindex_product(product_id):
+    SEARCH_INDEX.remove(product_id)
+    RELATED_GRAPH.remove(product_id)
+
+
+DATASET_PATH = "../source/json/"
+
+# Populate settings (override with environment variables)
+POPULATE_BATCH_SIZE = int(os.environ.get("POPULATE_BATCH_SIZE", 1000))
+POPULATE_READ_SIZE = int(os.environ.get("POPULATE_READ_SIZE", 65536))
+# Sync an already filled products collection with the dataset at startup
+CATALOG_SYNC = os.environ.get("CATALOG_SYNC", "false").lower() == "true"
 
 
 def populate_database():
     try:
-        dataset_path = "../source/json/"
-        populate_users(dataset_path)
-        populate_orders(dataset_path)
-        populate_products(dataset_path)
+        populate_users(DATASET_PATH)
+        populate_orders(DATASET_PATH)
+        populate_products(DATASET_PATH)
     except pymongo.errors.PyMongoError as e:
         LOG_SYS.write(TAG, f"An error occurred with MongoDB: {e}")
     except Exception as e:
         LOG_SYS.write(TAG, f"An unexpected error occurred: {e}")
 
 
+def load_collection(collection: pymongo.collection.Collection, dataset_file: str) -> Optional[int]:
+    # Stream the dataset into the collection by unordered batches of upserts on _id.
+    # A checkpoint in the Populate collection allows to resume an interrupted load,
+    # the upserts only insert missing documents so a batch can be safely loaded twice.
+    checkpoints = DATABASE["Populate"]
+    checkpoint = checkpoints.find_one({"_id": collection.name})
+    if collection.estimated_document_count() == 0:
+        # Never loaded, or emptied since the load (e.g. by /clearProducts): load it from the start
+        checkpoint = None
+    elif checkpoint is None or checkpoint.get("done", False):
+        # Already loaded, or filled before the checkpoints were introduced
+        return None
+
+    loaded = checkpoint.get("loaded", 0) if checkpoint is not None else 0
+    if loaded > 0:
+        LOG_SYS.write(TAG, f"Resuming the load of {collection.name} after {loaded} documents.")
+
+    written = 0
+    start = time.perf_counter()
+    documents = itertools.islice(iter_json(dataset_file, POPULATE_READ_SIZE), loaded, None)
+    while True:
+        batch = list(itertools.islice(documents, POPULATE_BATCH_SIZE))
+        if not batch:
+            break
+        collection.bulk_write([
+            UpdateOne({"_id": document["_id"]},
+                      {"$setOnInsert": {key: value for key, value in document.items() if key != "_id"}},
+                      upsert=True)
+            for document in batch
+        ], ordered=False)
+        loaded += len(batch)
+        written += len(batch)
+        checkpoints.update_one({"_id": collection.name}, {"$set": {"loaded": loaded, "done": False}}, upsert=True)
+    checkpoints.update_one({"_id": collection.name}, {"$set": {"loaded": loaded, "done": True}}, upsert=True)
+
+    elapsed = time.perf_counter() - start
+    peak_memory = get_peak_memory()
+    LOG_SYS.write(TAG, f"Loaded {written} documents into {collection.name} in {elapsed:.2f}s "
+                       f"({written / elapsed if elapsed > 0 else 0:.0f} docs/s, peak memory "
+                       f"{f'{peak_memory / 2 ** 20:.1f} MB' if peak_memory is not None else 'n/a'}).")
+    return loaded
+
+
 def populate_users(dataset_path):
-    users_dataset_path = dataset_path + "users.json"
-    users_dataset = list(read_json(users_dataset_path).values())
     users = DATABASE["Users"]
-    count = users.count_documents({})
-    if count > 0:
+    loaded = load_collection(users, dataset_path + "users.json")
+    if loaded is None:
         LOG_SYS.write(TAG, "A collection for users already exists.")
     else:
-        result = users.insert_many(users_dataset)
-        LOG_SYS.write(TAG, f"Filled the users collection with {len(result.inserted_ids)} documents.")
+        LOG_SYS.write(TAG, f"Filled the users collection with {loaded} documents.")
 
 
 def populate_orders(dataset_path):
-    orders_dataset_path = dataset_path + "orders.json"
-    orders_dataset = list(read_json(orders_dataset_path).values())
     orders = DATABASE["Orders"]
-    count = orders.count_documents({})
-    if count > 0:
+    loaded = load_collection(orders, dataset_path + "orders.json")
+    if loaded is None:
         LOG_SYS.write(TAG, "A collection for orders already exists.")
     else:
-        result = orders.insert_many(orders_dataset)
-        LOG_SYS.write(TAG, f"Filled the orders collection with {len(result.inserted_ids)} documents.")
+        LOG_SYS.write(TAG, f"Filled the orders collection with {loaded} documents.")
 
 
 def populate_products(dataset_path):
-    products_dataset_path = dataset_path + "products.json"
-    products_dataset = list(read_json(products_dataset_path).values())
     products = DATABASE["Products"]
-    count = products.count_documents({})
-    if count > 0:
+    loaded = load_collection(products, dataset_path + "products.json")
+    if loaded is None and CATALOG_SYNC:
+        sync_products(dataset_path + "products.json")
+    elif loaded is None:
         LOG_SYS.write(TAG, "A collection for products already exists.")
     else:
-        result = products.insert_many(products_dataset)
-        create_product_indices(products)
-        LOG_SYS.write(TAG, f"Filled the funko pops collection with {len(result.inserted_ids)} documents.")
+        LOG_SYS.write(TAG, f"Filled the funko pops collection with {loaded} documents.")
+
+# Live fields of a product, never overwritten by the catalog sync
+SYNC_PRESERVED_FIELDS = {"quantity", "pending_orders"}
+
+
+def catalog_hash(document: dict) -> str:
+    # Hash of the catalog fields of a product, independent of the fields order
+    fields = {key: value for key, value in document.items() if key not in SYNC_PRESERVED_FIELDS}
+    return hashlib.blake2b(orjson.dumps(fields, option=orjson.OPT_SORT_KEYS, default=str), digest_size=16).hexdigest()
+
+
+def sync_products(dataset_file: str, delete: bool = True, dry_run: bool = False) -> Tuple[dict, list, list]:
+    # Diff the products dataset against the collection and apply only the inserts, updates
+    # and deletes in bulk. Stock quantities and pending orders of stored products are kept.
+    start = time.perf_counter()
+    products = DATABASE["Products"]
+    stored = {}
+    for document in products.find({}, {field: 0 for field in SYNC_PRESERVED_FIELDS}):
+        stored[document["_id"]] = (catalog_hash(document), set(document))
+
+    operations = []
+    changed = []
+    summary = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    for document in iter_json(dataset_file, POPULATE_READ_SIZE):
+        product_id = document["_id"]
+        current = stored.pop(product_id, None)
+        if current is None:
+            operations.append(InsertOne(document))
+            summary["inserted"] += 1
+        elif current[0] != catalog_hash(document):
+            fields = {key: value for key, value in document.items() if key not in SYNC_PRESERVED_FIELDS}
+            update = {"$set": fields}
+            removed = current[1] - set(document) - SYNC_PRESERVED_FIELDS
+            if removed:
+                update["$unset"] = dict.fromkeys(removed, "")
+            operations.append(UpdateOne({"_id": product_id}, update))
+            summary["updated"] += 1
+        else:
+            summary["unchanged"] += 1
+            continue
+        changed.append(document)
+
+        if len(operations) >= POPULATE_BATCH_SIZE and not dry_run:
+            products.bulk_write(operations, ordered=False)
+            operations = []
+
+    # Products missing from the dataset
+    deleted = list(stored) if delete else []
+    summary["deleted"] = len(deleted)
+    if not dry_run:
+        if operations:
+            products.bulk_write(operations, ordered=False)
+        for i in range(0, len(deleted), POPULATE_BATCH_SIZE):
+            products.delete_many({"_id": {"$in": deleted[i:i + POPULATE_BATCH_SIZE]}})
+
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    summary["dry_run"] = dry_run
+    LOG_SYS.write(TAG, f"Catalog sync{' (dry run)' if dry_run else ''}: {summary['inserted']} inserted, "
+                       f"{summary['updated']} updated, {summary['deleted']} deleted, "
+                       f"{summary['unchanged']} unchanged in {summary['seconds']}s.")
+    return summary, changed, deleted
+
+
+async def sync_catalog(dataset_file: str = DATASET_PATH + "products.json", delete: bool = True, dry_run: bool = False) -> dict:
+    # Run the sync off the event loop, then refresh the search index and the caches
+    summary, changed, deleted = await asyncio.to_thread(sync_products, dataset_file, delete, dry_run)
+    if not dry_run and (changed or deleted):
+        for product_id in deleted:
+            unindex_product(product_id)
+        for document in changed:
+            index_product(document)
+        await catalog_changed([document["_id"] for document in changed] + deleted)
+    return summary
 
 ###################################################################################################
 
+@profiled
 async def get_all_users():
     # Collection Users
-    collection = DATABASE["Users"]
+    collection = get_collection(ASYNC_DATABASE, "Users")
     
     # Query to get all users
     LOG_SYS.write(TAG, "Query to get all users executing.")
-    users_data = list(collection.find())
+    users_data = await collection.find().to_list(length=None)
     if not users_data:
         LOG_SYS.write(TAG, "No Users found.")
         return []
@@ -108,16 +421,17 @@ async def get_all_users():
     return users
 
 
+@profiled
 async def get_user(username: str, email: str = None) -> User:
     # Collection Users
-    collection = DATABASE["Users"]
+    collection = get_collection(ASYNC_DATABASE, "Users")
     
     # Query to find the user in the collection by username or password
     LOG_SYS.write(TAG, f"Query to get user information by username: {username} or email: {email} executing.")
     query = {"username": username}
     if email is not None:
         query = {"$or": [{"username": username}, {"email": email}]}
-    user_data = collection.find_one(query)
+    user_data = await collection.find_one(query)
     
     # If the user is not found in the database, raise an exception
     if user_data is None:
@@ -130,12 +444,13 @@ async def get_user(username: str, email: str = None) -> User:
     return user
 
 
+@profiled
 async def insert_user(user_data: User, generate_uid: bool = True) -> str:
     # Collection Users
-    collection = DATABASE["Users"]
+    collection = get_collection(ASYNC_DATABASE, "Users")
     
     # Check if the user already exists (if true rise exeption)
-    existing_user_username = collection.find_one({"username": user_data.username})
+    existing_user_username = await collection.find_one({"username": user_data.username})
     if existing_user_username:
         LOG_SYS.write(TAG, f"Insert new user with username: {user_data.username} failed, user already exists.")
         raise HTTPException(status_code=400, detail="User already exists")
@@ -143,56 +458,60 @@ async def insert_user(user_data: User, generate_uid: bool = True) -> str:
     # Insert user with custom or random UID
     if not generate_uid:
         # Check if the user already exists (if true rise exeption)
-        existing_user_id = collection.find_one({"_id": user_data.id})
+        existing_user_id = await collection.find_one({"_id": user_data.id})
         if existing_user_id:
             LOG_SYS.write(TAG, f"Insert user with id: {user_data.id} failed, user already exists.")
             raise HTTPException(
                 status_code=400, detail="User already exists")
     else:
-        while (True):
-            # Generate a UID string for the user
-            user_data.id = generate_unique_id(length=13, alphanumeric=True)
-            existing_user_id = collection.find_one({"_id": user_data.id})
-            if not existing_user_id:
-                break
+        # Generate a time-ordered UID string for the user (unique without any lookup)
+        user_data.id = generate_id(alphanumeric=True)
 
     # Hashing the user password in bcrypt hash algorithm
-    user_data.password = hash_string(user_data.password)
-    collection.insert_one(user_data.model_dump(by_alias=True))
+    user_data.password = await async_hash_string(user_data.password)
+    try:
+        await collection.insert_one(user_data.model_dump(by_alias=True))
+    except pymongo.errors.DuplicateKeyError:
+        # Taken by a concurrent insert after the check (the username index is unique)
+        LOG_SYS.write(TAG, f"Insert new user with username: {user_data.username} failed, user already exists.")
+        raise HTTPException(status_code=400, detail="User already exists")
     LOG_SYS.write(TAG, "User data insert successfully.")
     return user_data
 
 
+@profiled
 async def delete_user(username: str) -> str:
     # Collection Users
-    collection = DATABASE["Users"]
+    collection = get_collection(ASYNC_DATABASE, "Users")
     
     # Delete one user data from the collection
     LOG_SYS.write(TAG, f"Deleting user with username: {username} from the database.")
-    result = collection.delete_one({"username": username})
+    result = await collection.delete_one({"username": username})
     LOG_SYS.write(TAG, f"Deleted {result.deleted_count} documents in the User collection.")
     LOG_SYS.write(TAG, f"User {username} deleted successfully.")
     return f"User {username} deletion successfully."
 
 
+@profiled
 async def clear_users() -> str:
     # Collection Users
-    collection = DATABASE["Users"]
+    collection = get_collection(ASYNC_DATABASE, "Users")
     
     # Delete all users from the collection
-    collection.delete_many({})
+    await collection.delete_many({})
     LOG_SYS.write(TAG, "All Users data deleted successfully.")
     return "Users collection cleared successfully."
 
 
+@profiled
 async def update_user(username: str, user_data: Optional[Union[User, Dict[str, Any]]]) -> str:
     # Collection Users
-    collection = DATABASE["Users"]
+    collection = get_collection(ASYNC_DATABASE, "Users")
     
     # Update user data from the collection
     newUserData = user_data.model_dump() if isinstance(user_data, User) else user_data
     LOG_SYS.write(TAG, f"Updating product data with id: {username} in the datbase.")
-    result = collection.update_one({"username": username}, {"$set": newUserData})
+    result = await collection.update_one({"username": username}, {"$set": newUserData})
     
     # Check if user was found and updated
     if result.matched_count == 0:
@@ -204,13 +523,14 @@ async def update_user(username: str, user_data: Optional[Union[User, Dict[str, A
 
 ###################################################################################################
 
+@profiled
 async def get_all_orders():
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Query to get all orders
     LOG_SYS.write(TAG, "Query to get all users executing.")
-    orders_data = list(collection.find())
+    orders_data = await collection.find().to_list(length=None)
     if not orders_data:
         LOG_SYS.write(TAG, "No Orders found.")
         return []
@@ -221,13 +541,14 @@ async def get_all_orders():
     return users
 
 
+@profiled
 async def get_orders_by_username(username: str) -> List[Order]:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Query to find user orders info in the collection by username and sort by date in descending order
     LOG_SYS.write(TAG, f"Query to get orders for username: {username} executing.")
-    orders_data = list(collection.find({"user.username": username}).sort("date", -1))
+    orders_data = await collection.find({"user.username": username}).sort("date", -1).to_list(length=None)
     if not orders_data:
         LOG_SYS.write(TAG, f"No orders found for username: {username}.")
         raise HTTPException(status_code=404, detail="Orders not found.")
@@ -238,13 +559,14 @@ async def get_orders_by_username(username: str) -> List[Order]:
     return orders
 
 
+@profiled
 async def get_order_info(order_id: str) -> Order:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Query to find order info in the collection by id
     LOG_SYS.write(TAG, f"Query to get order info forid: {order_id} executing.")
-    order_data = collection.find_one({"_id": order_id})
+    order_data = await collection.find_one({"_id": order_id})
     if order_data is None:
         LOG_SYS.write(TAG, f"Order with ID: {order_id} not found.")
         raise HTTPException(status_code=404, detail="Order not found.")
@@ -254,74 +576,154 @@ async def get_order_info(order_id: str) -> Order:
     return order
 
 
-async def insert_order(order_data: Order, generate_uid: bool = True) -> str:
+@profiled
+async def insert_order(order_data: Order, generate_uid: bool = True, session=None) -> str:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Insert order with custom or random UID
     if not generate_uid:
-        existing_order = collection.find_one({"_id": order_data.id})
+        existing_order = await collection.find_one({"_id": order_data.id})
         if existing_order:
             LOG_SYS.write(TAG, f"Insert order with id: {order_data.id} failed, order already exists.")
             raise HTTPException(
                 status_code=400, detail="Order already exists")
     else:
-        while (True):
-            # Generate a UID string for the order
-            order_data.id = generate_unique_id(length=13, alphanumeric=True)
-            # Check if order already exist (if false break the while)
-            existing_order = collection.find_one({"_id": order_data.id})
-            if not existing_order:
-                break
+        # Generate a time-ordered UID string for the order (sortable, so orders can be range-scanned by _id)
+        order_data.id = generate_id(alphanumeric=True)
 
     # Insert one new order data into database
-    collection.insert_one(order_data.model_dump(by_alias=True))
+    await collection.insert_one(order_data.model_dump(by_alias=True), session=session)
     LOG_SYS.write(TAG, "Order data insert successfully.")
     return f"Order {order_data.id} by user {order_data.user.username} inserted successfully."
 
 
+# Attempts of a transaction on the transient errors, e.g. a write conflict (override with environment variables)
+TRANSACTION_RETRIES = int(os.environ.get("TRANSACTION_RETRIES", 10))
+TRANSACTION_BACKOFF = float(os.environ.get("TRANSACTION_BACKOFF", 0.005))
+
+
+async def supports_transactions() -> bool:
+    # Multi-document transactions need a replica set or a sharded cluster
+    global TRANSACTIONS
+
+    if TRANSACTIONS is None:
+        hello = await ASYNC_DATABASE.command("hello")
+        TRANSACTIONS = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return TRANSACTIONS
+
+
+async def commit_transaction(session):
+    # Commit again while the outcome of the commit is unknown
+    for attempt in range(1, TRANSACTION_RETRIES + 1):
+        try:
+            await session.commit_transaction()
+            return
+        except PyMongoError as error:
+            if not error.has_error_label("UnknownTransactionCommitResult") or attempt == TRANSACTION_RETRIES:
+                raise
+
+
+async def run_transaction(callback):
+    # Run callback(session) in a transaction, all over again on a transient error (e.g. a write conflict)
+    # with a jittered backoff, at most TRANSACTION_RETRIES times
+    async with await ASYNC_DATABASE.client.start_session() as session:
+        for attempt in range(1, TRANSACTION_RETRIES + 1):
+            session.start_transaction()
+            try:
+                result = await callback(session)
+                await commit_transaction(session)
+                return result
+            except PyMongoError as error:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                if not error.has_error_label("TransientTransactionError") or attempt == TRANSACTION_RETRIES:
+                    raise
+            except BaseException:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                raise
+            LOG_SYS.write(TAG, f"Transaction aborted by a transient error, retrying ({attempt}/{TRANSACTION_RETRIES}).")
+            await asyncio.sleep(random.uniform(0, TRANSACTION_BACKOFF * (2 ** attempt)))
+
+
+@profiled
+async def place_order(order_data: Order) -> str:
+    # Insert the order and take its products from the warehouse, all or nothing
+    if await supports_transactions():
+        async def place(session):
+            result = await insert_order(order_data, session=session)
+            await update_product_warehouse(order_data.products, session=session)
+            return result
+
+        try:
+            return await run_transaction(place)
+        except PyMongoError as error:
+            if error.has_error_label("TransientTransactionError"):
+                LOG_SYS.write(TAG, f"Placing order failed, conflicts after {TRANSACTION_RETRIES} attempts.", level=WARNING)
+                raise HTTPException(status_code=503, detail="The order conflicts with other orders, try again.",
+                                    headers={"Retry-After": "1"})
+            if error.has_error_label("UnknownTransactionCommitResult"):
+                LOG_SYS.write(TAG, f"Placing order failed, unknown commit result: {error}.", level=ERROR)
+                raise HTTPException(status_code=503, detail="The outcome of the order is unknown, check the orders before trying again.")
+            raise
+
+    # Without transactions the order is removed again if the stock is short
+    result = await insert_order(order_data)
+    try:
+        await update_product_warehouse(order_data.products, order_id=order_data.id)
+    except Exception:
+        await get_collection(ASYNC_DATABASE, "Orders").delete_one({"_id": order_data.id})
+        raise
+    return result
+
+
+@profiled
 async def delete_order_by_id(order_id: str) -> str:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Delete one order data from the collection by id
     LOG_SYS.write(TAG, f"Deleting order data with id: {order_id} from the database.")
-    result = collection.delete_one({"_id": order_id})
+    result = await collection.delete_one({"_id": order_id})
     LOG_SYS.write(TAG, f"Deleted {result.deleted_count} documents in the Orders collection.")
     LOG_SYS.write(TAG, "Order data deleted successfully.")
     return f"Order {order_id} deleted successfully."
 
 
+@profiled
 async def delete_orders_by_username(username: str) -> str:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Delete one order data from the collection by username
     LOG_SYS.write(TAG, f"Deleting order data with username: {username} from the database.")
-    result = collection.delete_many({"user.username": username})
+    result = await collection.delete_many({"user.username": username})
     LOG_SYS.write(TAG, f"Deleted {result.deleted_count} documents in the Orders collection.")
     LOG_SYS.write(TAG, f"Order data of {username} deleted successfully.")
     return f"All order created by {username} deleted successfully."
 
 
+@profiled
 async def clear_orders() -> str:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Delete all orders from the collection
-    collection.delete_many({})
+    await collection.delete_many({})
     LOG_SYS.write(TAG, "All Orders data deleted successfully.")
     return "Orders collection cleared successfully."
 
 
+@profiled
 async def update_order(order_id: str, order_data: Optional[Union[Order, Dict[str, Any]]]) -> str:
     # Collection Orders
-    collection = DATABASE["Orders"]
+    collection = get_collection(ASYNC_DATABASE, "Orders")
     
     # Update order data in the collection
     newOrderData = order_data.model_dump() if isinstance(order_data, Product) else order_data
     LOG_SYS.write(TAG, f"Updating product data with id: {order_id} in the datbase.")
-    result = collection.update_one({"_id": order_id}, {"$set": newOrderData})
+    result = await collection.update_one({"_id": order_id}, {"$set": newOrderData})
     
     # Check if order was found and updated
     if result.matched_count == 0:
@@ -335,17 +737,280 @@ async def update_order(order_id: str, order_data: Optional[Union[Order, Dict[str
 
 AMOUNT_PRODUCT_PAGE = 20
 
+# Build Product models for the responses (otherwise the projected documents are encoded as they are)
+VALIDATE_RESPONSES = os.environ.get("VALIDATE_RESPONSES", "false").lower() == "true"
+
+
+def get_product_fields(fields: List[str] = None) -> Optional[tuple]:
+    # The requested product fields ("card" for the listing cards), checked against the Product model; None for all
+    if not fields:
+        return None
+    if fields == ["card"]:
+        return PRODUCT_CARD_FIELDS
+    unknown = [field for field in fields if field not in PRODUCT_PROJECTION]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown product fields: {', '.join(unknown)}.")
+    return tuple(dict.fromkeys(["_id", *fields]))
+
+
+def get_product_projection(fields: Optional[tuple]) -> dict:
+    # The projection is pushed down to the query, the other fields are never read nor encoded
+    if fields is None:
+        return PRODUCT_PROJECTION
+    return {field: PRODUCT_PROJECTION[field] for field in fields}
+
+
+def build_products(product_data: list, fields: Optional[tuple] = None) -> list:
+    # Only the whole products and the cards have a model, other sparse fieldsets are returned as they are
+    if VALIDATE_RESPONSES and fields is None:
+        return [Product(**product) for product in product_data]
+    if VALIDATE_RESPONSES and fields == PRODUCT_CARD_FIELDS:
+        return [ProductCard(**product) for product in product_data]
+    return product_data
+
+
+def build_product(product_data: dict):
+    return Product(**product_data) if VALIDATE_RESPONSES else product_data
+
+
+def get_product_ids(products: list) -> list:
+    return [product["_id"] if isinstance(product, dict) else product.id for product in products]
 
+
+# Caches of the products by id, of the listings and of the products count by (category, searchTerm)
+PRODUCT_CACHE = LRUCache(max_size=4096, ttl=300.0)
+PAGE_CACHE = LRUCache(max_size=1024, ttl=60.0)
+COUNT_CACHE = LRUCache(max_size=1024, ttl=30.0)
+
+# Product fields used by the combined filter (a change to one of them makes the counts stale)
+FILTER_FIELDS = {"interest", "title", "description", "product_type", "license", "vendor"}
+# Product fields that decide which listings include a product and in which order
+LISTING_FIELDS = FILTER_FIELDS | {"price"}
+
+
+def invalidate_products(product_id=None, fields=None):
+    # Drop the cached product and the cached listings it may belong to
+    if product_id is None:
+        PRODUCT_CACHE.clear()
+    else:
+        PRODUCT_CACHE.pop(product_id)
+
+    if fields is None or FILTER_FIELDS.intersection(fields):
+        COUNT_CACHE.clear()
+    if fields is None or LISTING_FIELDS.intersection(fields) or product_id is None:
+        PAGE_CACHE.clear()
+    else:
+        # Only the content of the product changed, its listings stay the same
+        PAGE_CACHE.invalidate_tag(product_id)
+
+
+# Catalog changes shared by the server processes, each one keeps its own search index, related graph and caches
+CATALOG_WATCH_INTERVAL = float(os.environ.get("CATALOG_WATCH_INTERVAL", 2.0))
+# The changes of this process are published only with several worker processes, or with CATALOG_PUBLISH=true
+# (e.g. for several servers): a single one only watches the changes of the others (e.g. of sync.py)
+CATALOG_PUBLISH = os.environ.get("CATALOG_PUBLISH", str(SERVER_WORKERS > 1)).lower() == "true"
+# Fields of the stock changes, published in batches by watch_catalog instead of one by one on the order path
+STOCK_FIELDS = {"quantity"}
+# Seconds to wait for a change numbered but not written yet, before reloading the whole catalog
+CATALOG_GAP_TIMEOUT = 10.0
+CATALOG_VERSION = 0         # last change applied by this process
+CATALOG_PUBLISHED = 0       # last change published by this process
+CATALOG_REVISION = 0        # changes of this process that were not published
+CATALOG_GAP_SINCE = None
+CATALOG_STOCK_PENDING = set()   # products with a stock change not published yet
+CATALOG_STOCK_REVISION = 0      # stock changes of this process
+
+
+async def catalog_changed(product_ids: list = None, fields=None):
+    # Invalidate the caches of this process and publish the change to the others (all products when no ids)
+    global CATALOG_REVISION
+    global CATALOG_STOCK_REVISION
+
+    if product_ids is None:
+        invalidate_products()
+    else:
+        for product_id in product_ids:
+            invalidate_products(product_id, fields)
+    if not CATALOG_PUBLISH:
+        CATALOG_REVISION += 1
+        return
+    if product_ids is not None and fields is not None and set(fields) <= STOCK_FIELDS:
+        # The search index and the related graph do not depend on the stock, only the caches of the others do
+        CATALOG_STOCK_PENDING.update(product_ids)
+        CATALOG_STOCK_REVISION += 1
+        return
+    await publish_catalog_change(product_ids, fields)
+
+
+async def publish_catalog_change(product_ids: list = None, fields=None) -> bool:
+    # Number the change with the Counters "catalog" document and write it for the other processes
+    global CATALOG_PUBLISHED
+    global CATALOG_REVISION
+
+    try:
+        counter = await ASYNC_DATABASE["Counters"].find_one_and_update(
+            {"_id": "catalog"}, {"$inc": {"value": 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        await ASYNC_DATABASE["CatalogChanges"].insert_one({
+            "_id": counter["value"],
+            "origin": PROCESS_ID,
+            "product_ids": list(product_ids) if product_ids is not None else None,
+            "fields": sorted(fields) if fields is not None else None,
+            "date": datetime.datetime.now(datetime.timezone.utc)
+        })
+        CATALOG_PUBLISHED = max(CATALOG_PUBLISHED, counter["value"])
+        return True
+    except Exception as e:
+        CATALOG_REVISION += 1
+        LOG_SYS.write(TAG, f"Publication of a catalog change failed: {e}", level=WARNING)
+        return False
+
+
+async def publish_stock_changes():
+    # One change for all the stock changes since the last call, retried on the next one if it fails
+    if not CATALOG_STOCK_PENDING:
+        return
+    product_ids = list(CATALOG_STOCK_PENDING)
+    CATALOG_STOCK_PENDING.clear()
+    if not await publish_catalog_change(product_ids, STOCK_FIELDS):
+        CATALOG_STOCK_PENDING.update(product_ids)
+
+
+def catalog_version() -> str:
+    # Version of the catalog served by this process, the same in all the processes once they applied the same changes.
+    # A change published here but not yet in order with the others, or not published at all, gives a version of its own.
+    version = str(CATALOG_VERSION)
+    if CATALOG_PUBLISHED > CATALOG_VERSION:
+        version += f"+{CATALOG_PUBLISHED}"
+    if CATALOG_REVISION or not CATALOG_PUBLISH:
+        version += f".{hashlib.blake2b(PROCESS_ID.encode(), digest_size=4).hexdigest()}.{CATALOG_REVISION}"
+    if CATALOG_STOCK_PENDING:
+        version += f".{hashlib.blake2b(PROCESS_ID.encode(), digest_size=4).hexdigest()}.s{CATALOG_STOCK_REVISION}"
+    return version
+
+
+async def apply_catalog_changes() -> int:
+    # Replay, in order, the changes published by the other processes since the last one applied
+    global CATALOG_VERSION
+    global CATALOG_GAP_SINCE
+
+    applied = 0
+    changes = ASYNC_DATABASE["CatalogChanges"].find({"_id": {"$gt": CATALOG_VERSION}}).sort("_id", 1)
+    async for change in changes:
+        if change["_id"] != CATALOG_VERSION + 1:
+            if CATALOG_GAP_SINCE is None:
+                CATALOG_GAP_SINCE = time.monotonic()
+            if time.monotonic() - CATALOG_GAP_SINCE < CATALOG_GAP_TIMEOUT:
+                break
+            # The missing change is lost (or expired): reload everything
+            change = {"_id": change["_id"], "origin": None, "product_ids": None, "fields": None}
+        CATALOG_GAP_SINCE = None
+
+        if change["origin"] != PROCESS_ID:
+            if change["product_ids"] is None:
+                LOG_SYS.write(TAG, "Reloading the products catalog changed by another process.")
+                # Built in a thread, installed on the event loop between two requests.
+                # The rebuild also moves CATALOG_VERSION to the last published change.
+                install_search_index(*await asyncio.to_thread(prepare_search_index))
+                invalidate_products()
+                return applied + 1
+            await apply_catalog_change(change["product_ids"], change["fields"])
+        CATALOG_VERSION = change["_id"]
+        applied += 1
+    return applied
+
+
+async def apply_catalog_change(product_ids: list, fields=None):
+    if fields is None or CATALOG_FIELDS.intersection(fields):
+        collection = get_collection(ASYNC_DATABASE, "Products")
+        products = {product_data["_id"]: product_data async for product_data in
+                    collection.find({"_id": {"$in": product_ids}}, {field: 1 for field in CATALOG_FIELDS})}
+        for product_id in product_ids:
+            if product_id in products:
+                index_product(products[product_id])
+            else:
+                unindex_product(product_id)
+    for product_id in product_ids:
+        invalidate_products(product_id, fields)
+
+
+async def watch_catalog():
+    # Poll the changes of the other processes until cancelled
+    while True:
+        await asyncio.sleep(CATALOG_WATCH_INTERVAL)
+        try:
+            await publish_stock_changes()
+            await apply_catalog_changes()
+        except Exception as e:
+            LOG_SYS.write(TAG, f"Catalog changes could not be applied: {e}", level=WARNING)
+
+
+def get_cache_stats() -> dict:
+    return {
+        "products": PRODUCT_CACHE.stats(),
+        "pages": PAGE_CACHE.stats(),
+        "counts": COUNT_CACHE.stats()
+    }
+
+
+@profiled
 async def get_unique_products_count(category: str, searchTerm: str) -> int:
+    # Count the matches in the search index when it is available
+    if SEARCH_INDEX.ready:
+        return SEARCH_INDEX.count(searchTerm, category)
+
+    # Return the cached count if it is recent enough
+    key = (category, searchTerm)
+    count = COUNT_CACHE.get(key)
+    if count is not None:
+        return count
+    generation = COUNT_CACHE.generation
+
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Getting cutom filter and count occurrence
     filter = getCombinedFilter(category, searchTerm)
-    count = collection.count_documents(filter)
+    count = await collection.count_documents(filter)
+    COUNT_CACHE.set(key, count, generation=generation)
     return count
 
 
+@profiled
+async def get_product_facets(category: str, searchTerm: str) -> dict:
+    # Counts from the search index (precomputed for an empty search on all the categories)
+    generation = COUNT_CACHE.generation
+    if SEARCH_INDEX.ready:
+        facets = SEARCH_INDEX.facets(searchTerm, category)
+    else:
+        # Return the cached facets if they are recent enough
+        key = ("facets", category, searchTerm)
+        facets = COUNT_CACHE.get(key)
+        if facets is not None:
+            return facets
+
+        # Collection Products
+        collection = get_collection(ASYNC_DATABASE, "Products")
+
+        # Count every facet field in one aggregation (list fields are unwound)
+        pipeline = [
+            {"$match": getCombinedFilter(category, searchTerm)},
+            {"$facet": {field: [
+                {"$unwind": f"${field}"},
+                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}
+            ] for field in FACET_FIELDS}}
+        ]
+        result = await collection.aggregate(pipeline).to_list(length=None)
+        facets = {field: {group["_id"]: group["count"] for group in result[0][field] if group["_id"] is not None}
+                  for field in FACET_FIELDS} if result else {field: {} for field in FACET_FIELDS}
+
+    # Most frequent values first
+    facets = {field: dict(sorted(counts.items(), key=lambda item: (-item[1], str(item[0]))))
+              for field, counts in facets.items()}
+    if not SEARCH_INDEX.ready:
+        COUNT_CACHE.set(("facets", category, searchTerm), facets, generation=generation)
+    return facets
+
+
 def getCombinedFilter(category: str, searchTerm: str) -> dict:
     # Create a combofilter between all possible filters
     category_filter = {} if category.lower() == "all" else {
@@ -362,34 +1027,126 @@ def getCombinedFilter(category: str, searchTerm: str) -> dict:
     return combined_filters
 
 
-async def get_all_products() -> List[Product]:
+def getIndexedFilter(category: str, searchTerm: str) -> dict:
+    # Replace the regex scan with the ids matched by the search index, when it is available
+    if not SEARCH_INDEX.ready:
+        return getCombinedFilter(category, searchTerm)
+    if not SEARCH_INDEX.tokenize(searchTerm):
+        return {} if category.lower() == "all" else {"interest": {"$in": [category]}}
+    return {"_id": {"$in": list(SEARCH_INDEX.match(searchTerm, category))}}
+
+
+async def find_products_by_ids(collection, product_ids: list, projection: dict = None) -> list:
+    # Fetch the products in one query and keep the order of the given ids
+    if projection is None:
+        projection = PRODUCT_PROJECTION
+    product_data = await collection.find({"_id": {"$in": product_ids}}, projection).to_list(length=None)
+    products_by_id = {product["_id"]: product for product in product_data}
+    return [products_by_id[product_id] for product_id in product_ids if product_id in products_by_id]
+
+
+def encode_cursor(criteria: Criteria, product_data: dict) -> str:
+    # The cursor stores the sort key and the _id of the last product of a page
+    field, _ = getCriteriaKeyset(criteria)
+    payload = {"c": criteria.value, "v": product_data.get(field), "id": product_data["_id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(criteria: Criteria, cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(payload, dict) or payload.get("c") != criteria.value or "id" not in payload:
+        raise HTTPException(status_code=400, detail="Cursor does not match the sorting criteria.")
+    return payload
+
+
+def getKeysetFilter(criteria: Criteria, payload: dict) -> dict:
+    # Select only the products that come after the cursor in the (field, _id) order
+    field, direction = getCriteriaKeyset(criteria)
+    operator = "$gt" if direction == 1 else "$lt"
+    if field == "_id":
+        return {"_id": {operator: payload["id"]}}
+    return {
+        "$or": [
+            {field: {operator: payload["v"]}},
+            {field: payload["v"], "_id": {operator: payload["id"]}}
+        ]
+    }
+
+
+async def find_products_page(collection, filter: dict, criteria: Criteria, limit: int, cursor: str = None,
+                             fields: Optional[tuple] = None) -> Tuple[list, Optional[str]]:
+    # One page of at most limit products in the (field, _id) order of the criteria, after the cursor if any,
+    # and the cursor of the next page. The sort and the limit are served by the (field, _id) indexes.
+    field, direction = getCriteriaKeyset(criteria)
+    sort = [(field, direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+    if cursor is not None:
+        filter = {"$and": [filter, getKeysetFilter(criteria, decode_cursor(criteria, cursor))]}
+
+    # Query one product more than a page to know if there is a next page (the cursor needs the sort field)
+    projection = get_product_projection(fields)
+    if field not in projection:
+        projection = {**projection, field: 1}
+    product_data = await collection.find(filter, projection).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(product_data) > limit:
+        product_data = product_data[:limit]
+        next_cursor = encode_cursor(criteria, product_data[-1])
+    if fields is not None and field not in fields:
+        for product in product_data:
+            product.pop(field, None)
+    return product_data, next_cursor
+
+
+@profiled
+async def get_all_products(fields: List[str] = None) -> List[Product]:
+    fields = get_product_fields(fields)
+
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Query to get all products
     LOG_SYS.write(TAG, "Query to get all products executing.")
-    products_data = list(collection.find())
+    products_data = await collection.find({}, get_product_projection(fields)).to_list(length=None)
     if not products_data:
         LOG_SYS.write(TAG, "No Products found.")
         return []
 
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in products_data]
+    products = build_products(products_data, fields)
     LOG_SYS.write(TAG, f"Found {len(products)} products.")
     return products
 
 
-async def get_products(category: str, searchTerm: str, criteria: Criteria, pageIndex: int) -> List[Product]:
+@profiled
+async def get_products(category: str, searchTerm: str, criteria: Criteria, pageIndex: int, fields: List[str] = None) -> List[Product]:
+    fields = get_product_fields(fields)
+
+    # Return the cached page if any
+    cache_key = ("page", category, searchTerm, criteria, pageIndex, fields)
+    products = PAGE_CACHE.get(cache_key)
+    if products is not None:
+        return products
+    generation = PAGE_CACHE.generation
+
     # Collection Products
-    collection = DATABASE["Products"]
-    
-    # Get a filter and sorting rule
-    LOG_SYS.write(TAG, "Creating a combined custom filter and sorter.")
-    filter = getCombinedFilter(category, searchTerm)
-    sort = getCriteriaSorting(criteria)
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
+    # Rank or sort the matching products with the search index when it is available
+    if SEARCH_INDEX.ready:
+        LOG_SYS.write(TAG, "Searching products in the search index.")
+        product_ids = SEARCH_INDEX.search(searchTerm, category, criteria)
+        count = len(product_ids)
+    else:
+        # Get a filter and sorting rule
+        LOG_SYS.write(TAG, "Creating a combined custom filter and sorter.")
+        filter = getCombinedFilter(category, searchTerm)
+        sort = getCriteriaSorting(criteria)
+        count = await get_unique_products_count(category, searchTerm)
+
     # Setup max page and range index
-    count = await get_unique_products_count(category, searchTerm)
     if count == 0:
         LOG_SYS.write(TAG, "No Products found.")
         return []
@@ -401,210 +1158,570 @@ async def get_products(category: str, searchTerm: str, criteria: Criteria, pageI
     LOG_SYS.write(TAG, "Query to get products pages executing.")
     start_range = pageIndex * AMOUNT_PRODUCT_PAGE
     end_range = min((pageIndex + 1) * AMOUNT_PRODUCT_PAGE, count)
-    product_data = list(collection.find(filter).sort(sort).skip(start_range).limit(end_range - start_range))
+    if SEARCH_INDEX.ready:
+        product_data = await find_products_by_ids(collection, product_ids[start_range:end_range], get_product_projection(fields))
+    else:
+        product_data = await collection.find(filter, get_product_projection(fields)).sort(sort).skip(start_range).limit(end_range - start_range).to_list(length=None)
     if not product_data:
         LOG_SYS.write(TAG, "No Products found.")
         return []
 
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in product_data]
+    products = build_products(product_data, fields)
+    PAGE_CACHE.set(cache_key, products, tags=get_product_ids(products), generation=generation)
     LOG_SYS.write(TAG, f"Found {len(products)} products.")
     return products
 
 
+@profiled
+async def get_products_page(category: str, searchTerm: str, criteria: Criteria, cursor: str = None, fields: List[str] = None) -> Tuple[List[Product], Optional[str]]:
+    fields = get_product_fields(fields)
+
+    # Return the cached page if any
+    cache_key = ("cursor", category, searchTerm, criteria, cursor, fields)
+    page = PAGE_CACHE.get(cache_key)
+    if page is not None:
+        return page
+    generation = PAGE_CACHE.generation
+
+    # Collection Products
+    collection = get_collection(ASYNC_DATABASE, "Products")
+
+    # Get a filter, the page is sorted and bounded on the criteria field and _id
+    LOG_SYS.write(TAG, "Creating a combined custom filter and keyset sorter.")
+    filter = getIndexedFilter(category, searchTerm)
+    LOG_SYS.write(TAG, "Query to get products page by cursor executing.")
+    product_data, next_cursor = await find_products_page(collection, filter, criteria, AMOUNT_PRODUCT_PAGE, cursor, fields)
+
+    # Build a list of instances of Product using the data retrieved from the database
+    products = build_products(product_data, fields)
+    PAGE_CACHE.set(cache_key, (products, next_cursor), tags=get_product_ids(products), generation=generation)
+    LOG_SYS.write(TAG, f"Found {len(products)} products.")
+    return products, next_cursor
+
+
+@profiled
 async def get_product_by_id(product_id: int) -> Product:
+    # Return the cached product if any
+    product = PRODUCT_CACHE.get(product_id)
+    if product is not None:
+        return product
+    generation = PRODUCT_CACHE.generation
+
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Query to find product info in the collection by id
     LOG_SYS.write(TAG, f"Query to get products info for id: {product_id} executing.")
-    products_data = collection.find_one({"_id": product_id})
+    products_data = await collection.find_one({"_id": product_id}, PRODUCT_PROJECTION)
     if products_data is None:
         LOG_SYS.write(TAG, f"Product with id: {product_id} not found.")
         raise HTTPException(status_code=404, detail="Product not found.")
 
     # Build an instance of Product using the data retrieved from the database
-    product = Product(**products_data)
+    product = build_product(products_data)
+    PRODUCT_CACHE.set(product_id, product, generation=generation)
     return product
 
 
-async def get_products_by_category(category: str) -> List[Product]:
+@profiled
+async def get_related_products(product_id: int, limit: int = 10, fallback: bool = True, fields: List[str] = None) -> List[Product]:
+    fields = get_product_fields(fields)
+
+    # Return the cached related products if any
+    cache_key = ("related", product_id, limit, fallback, fields)
+    products = PAGE_CACHE.get(cache_key)
+    if products is not None:
+        return products
+    generation = PAGE_CACHE.generation
+
+    # Collection Products
+    collection = get_collection(ASYNC_DATABASE, "Products")
+
+    # Resolve the related ids from the graph, or from the product document without it
+    LOG_SYS.write(TAG, f"Query to get related products for id: {product_id} executing.")
+    if RELATED_GRAPH.ready:
+        if product_id not in RELATED_GRAPH:
+            LOG_SYS.write(TAG, f"Product with id: {product_id} not found.")
+            raise HTTPException(status_code=404, detail="Product not found.")
+        related_ids = RELATED_GRAPH.resolve(product_id, limit, fallback)
+    else:
+        product_data = await collection.find_one({"_id": product_id}, {"related": 1})
+        if product_data is None:
+            LOG_SYS.write(TAG, f"Product with id: {product_id} not found.")
+            raise HTTPException(status_code=404, detail="Product not found.")
+        related_ids = list(dict.fromkeys(RELATED_GRAPH.normalize_id(related_id)
+                                         for related_id in product_data.get("related") or []))[:limit]
+
+    # Fetch all the related products in one batch (dangling ids are just not found)
+    product_data = await find_products_by_ids(collection, related_ids, get_product_projection(fields))
+    products = build_products(product_data, fields)
+    PAGE_CACHE.set(cache_key, products, tags=[product_id, *get_product_ids(products)], generation=generation)
+    LOG_SYS.write(TAG, f"Found {len(products)} related products.")
+    return products
+
+
+@profiled
+async def get_products_by_category(category: str, fields: List[str] = None) -> List[Product]:
+    fields = get_product_fields(fields)
+
+    # Return the cached listing if any
+    cache_key = ("category", category, fields)
+    products = PAGE_CACHE.get(cache_key)
+    if products is not None:
+        return products
+    generation = PAGE_CACHE.generation
+
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Query to find products info in the collection by category
     LOG_SYS.write(TAG, f"Query to get products by category '{category}' executing.")
-    product_data = list(collection.find({"interest": {"$in": [category]}}))
+    product_data = await collection.find({"interest": {"$in": [category]}}, get_product_projection(fields)).to_list(length=None)
     if not product_data:
         LOG_SYS.write(TAG, f"No Products found for category '{category}'.")
         return []
     
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in product_data]
+    products = build_products(product_data, fields)
+    PAGE_CACHE.set(cache_key, products, tags=get_product_ids(products), generation=generation)
     LOG_SYS.write(TAG, f"Found {len(products)} products for category '{category}'.")
     return products
 
 
-async def get_product_by_product_type(product_type: str) -> List[Product]:
+@profiled
+async def get_product_by_product_type(product_type: str, fields: List[str] = None) -> List[Product]:
+    fields = get_product_fields(fields)
+
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Query to find products info in the collection by product type
     LOG_SYS.write(TAG, f"Query to get products by search string '{product_type}' executing.")
-    product_data = list(collection.find({"product_type": {"$regex": f".*{product_type}.*", "$options": "i"}}))
+    product_data = await collection.find({"product_type": {"$regex": f".*{product_type}.*", "$options": "i"}}, get_product_projection(fields)).to_list(length=None)
     if not product_data:
         LOG_SYS.write(TAG, f"No Products found for product type: '{product_type}'.")
         return []
 
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in product_data]
+    products = build_products(product_data, fields)
     LOG_SYS.write(TAG, f"Found {len(products)} products for product type '{product_type}'.")
     return products
 
 
-async def get_product_by_search(search_string: str) -> List[Product]:
+@profiled
+async def get_product_by_search(search_string: str, fields: List[str] = None) -> List[Product]:
+    fields = get_product_fields(fields)
+
+    # Return the cached listing if any
+    cache_key = ("search", search_string, fields)
+    products = PAGE_CACHE.get(cache_key)
+    if products is not None:
+        return products
+    generation = PAGE_CACHE.generation
+
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Query to find products info in the collection by product type
     LOG_SYS.write(TAG, f"Query to get products by search string '{search_string}' executing.")
-    product_data = list(collection.find({
-        "$or": [
-            {"title": {"$regex": search_string, "$options": "i"}},
-            {"description": {"$regex": search_string, "$options": "i"}},
-            {"product_type": {"$regex": search_string, "$options": "i"}}
-        ]
-    }))
+    if SEARCH_INDEX.ready:
+        product_data = await find_products_by_ids(collection, SEARCH_INDEX.search(search_string), get_product_projection(fields))
+    else:
+        product_data = await collection.find({
+            "$or": [
+                {"title": {"$regex": search_string, "$options": "i"}},
+                {"description": {"$regex": search_string, "$options": "i"}},
+                {"product_type": {"$regex": search_string, "$options": "i"}}
+            ]
+        }, get_product_projection(fields)).to_list(length=None)
     if not product_data:
         LOG_SYS.write(TAG, f"No Products found for search string '{search_string}'.")
         return []
 
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in product_data]
+    products = build_products(product_data, fields)
+    PAGE_CACHE.set(cache_key, products, tags=get_product_ids(products), generation=generation)
     LOG_SYS.write(TAG, f"Found {len(products)} products for search string '{search_string}'.")
     return products
 
 
-async def sort_product_by_price(price: float = None, asc: bool = True) -> List[Product]:
+# Page size of the sorted listings, and the largest page (or top-K) a request can ask for
+SORT_PAGE_SIZE = int(os.environ.get("SORT_PAGE_SIZE", 100))
+SORT_MAX_LIMIT = int(os.environ.get("SORT_MAX_LIMIT", 1000))
+
+
+@profiled
+async def sort_product_by_price(price: float = None, asc: bool = True, fields: List[str] = None, min_price: float = None,
+                                limit: int = SORT_PAGE_SIZE, cursor: str = None) -> Tuple[List[Product], Optional[str]]:
+    fields = get_product_fields(fields)
+    if min_price is not None and price is not None and min_price > price:
+        raise HTTPException(status_code=400, detail="The minimum price is greater than the maximum price.")
+
     # Collection Products
-    collection = DATABASE["Products"]
-    sort_order = 1 if asc else -1
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
-    # Define sorting criteria and query filter in a more compact way
-    query_filter = ({"price": {"$lte": price}})
-    sort_criteria = ([("price", sort_order)])
+    # The price range bounds the scan of the (price, _id) index, that also gives the order
+    query_filter = {}
+    if min_price is not None:
+        query_filter["$gte"] = min_price
+    if price is not None:
+        query_filter["$lte"] = price
+    query_filter = {"price": query_filter} if query_filter else {}
+    criteria = Criteria.PRICE_ASCENDING if asc else Criteria.PRICE_DESCENDING
     
     # Query to sort products by criteria and order
     LOG_SYS.write(TAG, f"Query to sort products by price in {'ascending' if asc else 'descending'} order executing.")
-    product_data = list(collection.find(query_filter).sort(sort_criteria))
+    product_data, next_cursor = await find_products_page(collection, query_filter, criteria, min(limit, SORT_MAX_LIMIT), cursor, fields)
     if not product_data:
         LOG_SYS.write(TAG, f"No Products found for sorting by price in {'ascending' if asc else 'descending'} order.")
-        return []
+        return [], None
 
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in product_data]
+    products = build_products(product_data, fields)
     LOG_SYS.write(TAG, f"Sorted {len(products)} products by price in {'ascending' if asc else 'descending'} order.")
-    return products
+    return products, next_cursor
 
 
-async def sort_product_by_name(asc: bool = True) -> List[Product]:
+@profiled
+async def sort_product_by_name(asc: bool = True, fields: List[str] = None, limit: int = SORT_PAGE_SIZE,
+                               cursor: str = None) -> Tuple[List[Product], Optional[str]]:
+    fields = get_product_fields(fields)
+
     # Collection Products
-    collection = DATABASE["Products"]
-    sort_order = 1 if asc else -1
-    
-    # Define sorting criteria and query filter in a more compact way
-    sort_criteria = ([("title", sort_order)])
+    collection = get_collection(ASYNC_DATABASE, "Products")
+    criteria = Criteria.TITLE_ASCENDING if asc else Criteria.TITLE_DESCENDING
     
-    # Query to sort products by name in order
-    LOG_SYS.write(TAG, f"Query to sort products by price in {'ascending' if asc else 'descending'} order executing.")
-    product_data = list(collection.find().sort(sort_criteria))
+    # Query to sort products by name in order, on the (title, _id) index
+    LOG_SYS.write(TAG, f"Query to sort products by name in {'ascending' if asc else 'descending'} order executing.")
+    product_data, next_cursor = await find_products_page(collection, {}, criteria, min(limit, SORT_MAX_LIMIT), cursor, fields)
     if not product_data:
-        LOG_SYS.write(TAG, f"No Products found for sorting by price in {'ascending' if asc else 'descending'} order.")
-        return []
+        LOG_SYS.write(TAG, f"No Products found for sorting by name in {'ascending' if asc else 'descending'} order.")
+        return [], None
 
     # Build a list of instances of Product using the data retrieved from the database
-    products = [Product(**product) for product in product_data]
-    LOG_SYS.write(TAG, f"Sorted {len(products)} products by price in {'ascending' if asc else 'descending'} order.")
-    return products
+    products = build_products(product_data, fields)
+    LOG_SYS.write(TAG, f"Sorted {len(products)} products by name in {'ascending' if asc else 'descending'} order.")
+    return products, next_cursor
+
 
+# Attempts of an insert with a generated id already taken
+INSERT_ID_RETRIES = 3
 
+
+@profiled
 async def insert_product(product_data: Product, generate_uid: bool = True) -> str:
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Insert product with custom or random UID
     if not generate_uid:
-        existing_product = collection.find_one({"_id": product_data.id})
+        existing_product = await collection.find_one({"_id": product_data.id})
         if existing_product:
             LOG_SYS.write(    TAG, f"Insert product with id: {product_data.id} failed, product already exists.")
             raise HTTPException(
                 status_code=400, detail="Product already exists")
     else:
-        while (True):
-            # Generate a UID string for the product
-            product_data.id = generate_unique_id(length=13, alphanumeric=False)
-            existing_product = collection.find_one({"_id": product_data.id})
-            if not existing_product:
-                break
+        # Generate a time-ordered 13 digits UID for the product (unique without any lookup)
+        product_data.id = generate_id(alphanumeric=False)
 
     # Insert one new product data into database
-    collection.insert_one(product_data.model_dump(by_alias=True))
+    for attempt in range(1, INSERT_ID_RETRIES + 1):
+        new_product = product_data.model_dump(by_alias=True)
+        try:
+            await collection.insert_one(new_product)
+            break
+        except pymongo.errors.DuplicateKeyError:
+            # A custom id taken after the check, or a generated one taken by a product inserted with a custom id
+            if not generate_uid or attempt == INSERT_ID_RETRIES:
+                LOG_SYS.write(TAG, f"Insert product with id: {product_data.id} failed, product already exists.")
+                raise HTTPException(status_code=400, detail="Product already exists")
+            product_data.id = generate_id(alphanumeric=False)
+    index_product(new_product)
+    await catalog_changed([product_data.id])
     LOG_SYS.write(TAG, "Product data insert successfully.")
     return f"Product {product_data.id} inserted successfully."
 
 
+@profiled
 async def delete_product(product_id: int) -> str:
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Delete one product data from the collection by id
     LOG_SYS.write(TAG, f"Deleting product data with id: {product_id} from the database.")
-    result = collection.delete_one({"_id": product_id})
+    result = await collection.delete_one({"_id": product_id})
+    unindex_product(product_id)
+    await catalog_changed([product_id])
     LOG_SYS.write(TAG, f"Deleted {result.deleted_count} documents in the Products collection.")
     LOG_SYS.write(TAG, f"Product data {product_id} deleted successfully.")
     return f"Product {product_id} deleted successfully."
 
 
+@profiled
 async def clear_products() -> str:
     # Collection Products
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Delete all products from the collection
-    collection.delete_many({})
+    await collection.delete_many({})
+    SEARCH_INDEX.clear()
+    RELATED_GRAPH.clear()
+    await catalog_changed()
     LOG_SYS.write(TAG, "All Products data deleted successfully.")
     return "Products collection cleared successfully."
 
 
-async def update_product_warehouse(products: List[Optional[Union[OrderProduct, Dict[str, Any]]]]):
+async def restore_product_warehouse(collection, amounts: dict, order_id):
+    # Give back the stock taken for an order, only by the products marked with its id
+    try:
+        await collection.bulk_write([
+            UpdateOne({"_id": product_id, "pending_orders": order_id},
+                      {"$inc": {"quantity": amount}, "$pull": {"pending_orders": order_id}})
+            for product_id, amount in amounts.items()
+        ], ordered=False)
+    except Exception as e:
+        LOG_SYS.write(TAG, f"Restoring stock of order {order_id} failed: {e}.", level=ERROR)
+
+
+@profiled
+async def update_product_warehouse(products: List[Optional[Union[OrderProduct, Dict[str, Any]]]], order_id=None, session=None):
     # Collection Prodcuts
-    collection = DATABASE["Products"]
-    
-    # Update product quantity in the collection
+    collection = get_collection(ASYNC_DATABASE, "Products")
+
+    # Total amount by product (the same product may appear more than once)
+    amounts = {}
     for product in products:
-        LOG_SYS.write(TAG, f"Updateing {product.id} stock in the warehouse.")
-        amount_value = product.amount
-        quantity_value = collection.find_one({"_id": product.id}, {"quantity": 1}).get("quantity", 0)
-        restock = max(quantity_value - amount_value, 0)
-        await update_product(product.id, {"quantity": restock})
-      
+        product_id = product.id if isinstance(product, OrderProduct) else product["_id"]
+        amount = product.amount if isinstance(product, OrderProduct) else product["amount"]
+        if amount <= 0:
+            LOG_SYS.write(TAG, f"Updating stock failed, invalid amount {amount} for product: {product_id}.", level=WARNING)
+            raise HTTPException(status_code=400, detail=f"Invalid amount for product: {product_id}")
+        amounts[product_id] = amounts.get(product_id, 0) + amount
+
+    # Decrement every stock in one bulk write, only where the quantity is enough.
+    # Outside a transaction the order id marks the decremented products to undo them on failure.
+    LOG_SYS.write(TAG, f"Updating stock of {len(amounts)} products in the warehouse.")
+    operations = []
+    for product_id, amount in amounts.items():
+        update = {"$inc": {"quantity": -amount}}
+        if session is None and order_id is not None:
+            update["$push"] = {"pending_orders": order_id}
+        operations.append(UpdateOne({"_id": product_id, "quantity": {"$gte": amount}}, update))
+    try:
+        result = await collection.bulk_write(operations, ordered=False, session=session)
+    except Exception:
+        # Some decrements may have been applied before the failure
+        if session is None and order_id is not None:
+            await restore_product_warehouse(collection, amounts, order_id)
+        raise
+
+    if result.matched_count < len(operations):
+        if session is None and order_id is not None:
+            await restore_product_warehouse(collection, amounts, order_id)
+
+        # Report the products without enough stock (read outside the transaction, before its writes)
+        stock_data = await collection.find({"_id": {"$in": list(amounts)}}, {"quantity": 1}).to_list(length=None)
+        stock = {product["_id"]: product.get("quantity", 0) for product in stock_data}
+        short = [product_id for product_id, amount in amounts.items() if stock.get(product_id, 0) < amount]
+        LOG_SYS.write(TAG, f"Updating stock failed, not enough quantity for products: {short}.")
+        raise HTTPException(status_code=409, detail=f"Not enough stock for products: {short}")
+
+    if session is None and order_id is not None:
+        await collection.update_many({"_id": {"$in": list(amounts)}}, {"$pull": {"pending_orders": order_id}})
+
+    await catalog_changed(list(amounts), {"quantity"})
     return "All quantity product in the warehouse are updated."
 
 
+@profiled
 async def update_product(product_id: int, product_data: Optional[Union[Product, Dict[str, Any]]]) -> str:
     # Collection Prodcuts
-    collection = DATABASE["Products"]
+    collection = get_collection(ASYNC_DATABASE, "Products")
     
     # Update product data in the collection
     newProductData = product_data.model_dump() if isinstance(product_data, Product) else product_data
     LOG_SYS.write(TAG, f"Updating product data with id: {product_id} in the datbase.")
-    result = collection.update_one({"_id": product_id}, {"$set": newProductData})
+    result = await collection.update_one({"_id": product_id}, {"$set": newProductData})
     
     # Check if order was found and updated
     if result.matched_count == 0:
         LOG_SYS.write(TAG, f"Updating existing product with id: {product_id} failed, product not found.")
         raise HTTPException(status_code=404, detail="Product not found")
+    await catalog_changed([product_id], newProductData.keys())
+
+    # Reindex the product if a searchable or related field changed
+    if CATALOG_FIELDS.intersection(newProductData.keys()):
+        indexed_data = await collection.find_one({"_id": product_id}, {field: 1 for field in CATALOG_FIELDS})
+        if indexed_data is not None:
+            index_product(indexed_data)
 
     LOG_SYS.write(TAG, "Product data updated successfully.")
     return f"Product {product_id} updated successfully."
 
-###################################################################################################
\ No newline at end of file
+###################################################################################################
+
+# Operations written by one bulk_write (override with environment variables)
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 1000))
+
+# Model, key of the update/delete operations and kind of generated ids of every collection
+BULK_MODELS = {"Products": Product, "Users": User, "Orders": Order}
+BULK_KEYS = {"Products": "_id", "Users": "username", "Orders": "_id"}
+BULK_ALPHANUMERIC_IDS = {"Products": False, "Users": True, "Orders": True}
+
+
+def parse_bulk_operation(collection_name: str, raw_operation) -> Tuple[BulkOperation, Any, Optional[dict]]:
+    # Validate an operation, returning it with its key and the document (insert) or fields (update)
+    operation = BulkOperation.model_validate(raw_operation)
+    key = operation.key
+    if collection_name == "Products" and isinstance(key, str) and key.isdigit():
+        key = int(key)
+
+    if operation.op == BulkOperationType.INSERT:
+        document = BULK_MODELS[collection_name].model_validate(operation.data or {}).model_dump(by_alias=True)
+        if document.get("_id") in (None, -1):
+            document.pop("_id", None)
+        return operation, document.get(BULK_KEYS[collection_name]), document
+
+    if key is None:
+        raise ValueError(f"A key is required to {operation.op.value} a document.")
+    if operation.op == BulkOperationType.UPDATE:
+        fields = {field: value for field, value in (operation.data or {}).items() if field != "_id"}
+        if not fields:
+            raise ValueError("No fields to update.")
+        return operation, key, fields
+    return operation, key, None
+
+
+async def bulk_write_batch(collection_name: str, batch: list, start: int, results: list, changes: dict):
+    collection = get_collection(ASYNC_DATABASE, collection_name)
+    key_field = BULK_KEYS[collection_name]
+
+    # Validate every operation, an invalid one only fails its own item
+    parsed = []
+    for offset, raw_operation in enumerate(batch):
+        index = start + offset
+        try:
+            operation, key, data = parse_bulk_operation(collection_name, raw_operation)
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(str(loc) for loc in detail['loc'])}: {detail['msg']}" for detail in e.errors())
+            results[index] = {"index": index, "op": None, "key": None, "status": 422, "error": error}
+            continue
+        except ValueError as e:
+            results[index] = {"index": index, "op": None, "key": None, "status": 422, "error": str(e)}
+            continue
+        parsed.append((index, operation.op, key, data))
+
+    # One query for the documents of the batch that already exist
+    keys = [key for _, _, key, _ in parsed if key is not None]
+    existing = set()
+    if keys:
+        existing = {document[key_field] async for document in collection.find({key_field: {"$in": keys}}, {key_field: 1})}
+
+    operations, items, passwords = [], [], []
+    seen = set()
+    for index, op, key, data in parsed:
+        if op == BulkOperationType.INSERT:
+            if key is not None and (key in existing or key in seen):
+                results[index] = {"index": index, "op": op.value, "key": key, "status": 409, "error": "Document already exists."}
+                continue
+            if "_id" not in data:
+                data["_id"] = generate_id(BULK_ALPHANUMERIC_IDS[collection_name])
+            if collection_name == "Users":
+                passwords.append(data)
+            key = data[key_field]
+            seen.add(key)
+            operations.append(InsertOne(data))
+        elif key not in existing:
+            results[index] = {"index": index, "op": op.value, "key": key, "status": 404, "error": "Document not found."}
+            continue
+        elif op == BulkOperationType.UPDATE:
+            if collection_name == "Users" and "password" in data:
+                passwords.append(data)
+            operations.append(UpdateOne({key_field: key}, {"$set": data}))
+        else:
+            operations.append(DeleteOne({key_field: key}))
+        items.append((index, op, key, data))
+        results[index] = {"index": index, "op": op.value, "key": key, "status": getBulkStatusCode(op)}
+
+    if not operations:
+        return
+
+    # Hash the passwords of the users concurrently on the hashing pool
+    hashes = await asyncio.gather(*(async_hash_string(data["password"]) for data in passwords))
+    for data, password in zip(passwords, hashes):
+        data["password"] = password
+
+    # Unordered write of the batch, the failed operations are reported on their own items
+    failed = set()
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            index, op, key, _ = items[error["index"]]
+            failed.add(index)
+            status = 409 if error.get("code") == 11000 else 400
+            results[index] = {"index": index, "op": op.value, "key": key, "status": status, "error": error.get("errmsg")}
+
+    for index, op, key, data in items:
+        if index not in failed:
+            changes[op].append(data if op == BulkOperationType.INSERT else key)
+
+
+@profiled
+async def bulk_write_documents(collection_name: str, raw_operations: list) -> dict:
+    # Apply inserts, updates and deletes by unordered batches, with a result for every operation
+    LOG_SYS.write(TAG, f"Bulk write of {len(raw_operations)} operations on {collection_name} executing.")
+    results = [None] * len(raw_operations)
+    changes = {op: [] for op in BulkOperationType}
+    for start in range(0, len(raw_operations), BULK_BATCH_SIZE):
+        await bulk_write_batch(collection_name, raw_operations[start:start + BULK_BATCH_SIZE], start, results, changes)
+
+    # Keep the search index, the related graph and the caches in line with the products
+    if collection_name == "Products" and any(changes.values()):
+        for product_id in changes[BulkOperationType.DELETE]:
+            unindex_product(product_id)
+        for product_data in changes[BulkOperationType.INSERT]:
+            index_product(product_data)
+        if changes[BulkOperationType.UPDATE]:
+            collection = get_collection(ASYNC_DATABASE, "Products")
+            async for product_data in collection.find({"_id": {"$in": changes[BulkOperationType.UPDATE]}},
+                                                      {field: 1 for field in CATALOG_FIELDS}):
+                index_product(product_data)
+        await catalog_changed([product_data["_id"] for product_data in changes[BulkOperationType.INSERT]]
+                              + changes[BulkOperationType.UPDATE] + changes[BulkOperationType.DELETE])
+
+    summary = {
+        "inserted": len(changes[BulkOperationType.INSERT]),
+        "updated": len(changes[BulkOperationType.UPDATE]),
+        "deleted": len(changes[BulkOperationType.DELETE]),
+        "failed": sum(1 for result in results if result["status"] >= 400),
+        "results": results
+    }
+    LOG_SYS.write(TAG, f"Bulk write on {collection_name}: {summary['inserted']} inserted, {summary['updated']} updated, "
+                       f"{summary['deleted']} deleted, {summary['failed']} failed.")
+    return summary
+
+###################################################################################################
+EXPORT_BATCH_SIZE = 500
+
+
+async def stream_documents(collection_name: str, fields: List[str] = None):
+    # Collection to export
+    collection = get_collection(ASYNC_DATABASE, collection_name)
+
+    # Project on the requested fields (products default to the Product fields)
+    projection = None
+    if collection_name == "Products":
+        if fields == ["card"]:
+            fields = list(PRODUCT_CARD_FIELDS)
+        projection = {field: PRODUCT_PROJECTION.get(field, 1) for field in fields} if fields else PRODUCT_PROJECTION
+    elif fields:
+        projection = {field: 1 for field in fields}
+
+    # Iterate the cursor, the driver fetches EXPORT_BATCH_SIZE documents per round trip
+    LOG_SYS.write(TAG, f"Query to stream all documents of {collection_name} executing.")
+    async for document in collection.find({}, projection, batch_size=EXPORT_BATCH_SIZE):
+        yield document
+
+###################################################################################################
@@ -0,0 +1,31 @@
+# Catalog Sync
+# To Run (from the server directory): python sync.py --dry-run
+
+import asyncio
+import argparse
+
+import mongo
+from utils.database import close_connection
+
+###################################################################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply the changes of the products dataset to the database.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--db-name", default="WTFunko")
+    parser.add_argument("--dataset", default=mongo.DATASET_PATH + "products.json")
+    parser.add_argument("--keep-missing", dest="delete", action="store_false", help="Do not delete the products missing from the dataset.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the changes, without applying them.")
+    args = parser.parse_args()
+
+    mongo.connect(host=args.host, port=args.port, db_name=args.db_name, populate=False)
+    summary, changed, deleted = mongo.sync_products(args.dataset, args.delete, args.dry_run)
+    print(summary)
+    if not args.dry_run and (changed or deleted):
+        # The running servers reload their search index, related graph and caches when they see the change
+        if asyncio.run(mongo.publish_catalog_change()):
+            print("Catalog change published to the running servers.")
+        else:
+            print("Publication of the catalog change failed: restart the running servers or call /syncCatalog.")
+    close_connection()
@@ -0,0 +1,91 @@
+# Cache Class
+import time
+from collections import OrderedDict
+
+class LRUCache(object):
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        self.generation = 0             # bumped by every invalidation
+        self._entries = OrderedDict()   # key -> (value, expiry time, tags)
+        self._tags = {}                 # tag -> keys of the entries holding it
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[1] < time.monotonic():
+            # Expired entries count as misses, not evictions
+            self._discard(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, tags=(), generation=None):
+        # The tags (e.g. product ids) allow to invalidate every entry holding one of them.
+        # A value read when the cache was at an older generation may predate an invalidation: it is not stored.
+        if generation is not None and generation != self.generation:
+            self.stale_sets += 1
+            return
+        if key in self._entries:
+            self._discard(key)
+        tags = frozenset(tags)
+        self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        # Evict the least recently used entries over the maximum size
+        while len(self._entries) > self.max_size:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def pop(self, key):
+        self.generation += 1
+        if key in self._entries:
+            self._discard(key)
+            self.invalidations += 1
+
+    def invalidate_tag(self, tag):
+        self.generation += 1
+        for key in list(self._tags.get(tag, ())):
+            self._discard(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def _discard(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_sets": self.stale_sets
+        }
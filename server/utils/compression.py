@@ -0,0 +1,158 @@
+# Compression Middleware
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:     # optional: without it only gzip is offered
+    brotli = None
+
+# Compression settings (override with environment variables)
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", 4))
+
+# Media types worth compressing
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+class Compressor(object):
+    # Incremental gzip or brotli compressor of a response body
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware(object):
+    # Plain ASGI middleware compressing the responses with the encoding preferred by the client
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(get_header(scope["headers"], b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk tells if the response is worth compressing
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = start_message["headers"]
+                if is_compressible(start_message["status"], headers):
+                    headers = add_vary(headers)
+                    # A streamed body is always compressed, a single one only above the threshold
+                    if more_body or len(body) >= self.minimum_size:
+                        compressor = Compressor(encoding)
+                        headers = [(name, value) for name, value in headers if name.lower() != b"content-length"]
+                        headers.append((b"content-encoding", encoding.encode()))
+                        headers = encode_etag(headers, encoding)
+                await send({**start_message, "headers": headers})
+                start_message = None
+
+            if compressor is not None:
+                body = compressor.compress(body) if more_body else compressor.finish(body)
+                if more_body and not body:
+                    return
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+###################################################################################################
+
+def get_header(headers: list, name: bytes) -> str:
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def negotiate_encoding(accept_encoding: str):
+    # The supported encoding with the highest quality in Accept-Encoding (brotli first on a tie)
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in offered:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(status: int, headers: list) -> bool:
+    if status < 200 or status in (204, 304):
+        return False
+    if get_header(headers, b"content-encoding"):
+        return False
+    content_type = get_header(headers, b"content-type")
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def encode_etag(headers: list, encoding: str) -> list:
+    # A strong ETag matches byte for byte: every encoding of a resource gets its own, e.g. "<tag>-gzip"
+    etag = get_header(headers, b"etag")
+    if not etag.endswith('"'):
+        return headers
+    headers = [(name, value) for name, value in headers if name.lower() != b"etag"]
+    headers.append((b"etag", f'{etag[:-1]}-{encoding}"'.encode("latin-1")))
+    return headers
+
+
+def decode_etag(etag: str) -> str:
+    # The ETag of the resource from the ETag of one of its encodings (for the If-None-Match comparisons)
+    for encoding in ("gzip", "br"):
+        if etag.endswith(f'-{encoding}"'):
+            return etag[:-len(encoding) - 2] + '"'
+    return etag
+
+
+def add_vary(headers: list) -> list:
+    vary = get_header(headers, b"vary")
+    if "accept-encoding" in vary.lower():
+        return headers
+    headers = [(name, value) for name, value in headers if name.lower() != b"vary"]
+    headers.append((b"vary", (f"{vary}, Accept-Encoding" if vary else "Accept-Encoding").encode("latin-1")))
+    return headers
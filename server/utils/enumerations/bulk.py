@@ -0,0 +1,14 @@
+# Enumeration - Bulk
+from enum import Enum
+
+class BulkOperationType(str, Enum):
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+def getBulkStatusCode(operation_type:BulkOperationType):
+    # Status code of a successful operation in the per-item results
+    if operation_type == BulkOperationType.INSERT:
+        return 201
+    return 200
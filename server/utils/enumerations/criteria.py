@@ -20,4 +20,16 @@ def getCriteriaSorting(criteria:Criteria):
         return [("title", 1)]
     if criteria == Criteria.TITLE_DESCENDING:
         return [("title", -1)]
-    
\ No newline at end of file
+
+
+def getCriteriaKeyset(criteria:Criteria):
+    # Field and direction used by cursor pagination ("_id" is always the tie-breaker)
+    if criteria == Criteria.PRICE_ASCENDING:
+        return ("price", 1)
+    if criteria == Criteria.PRICE_DESCENDING:
+        return ("price", -1)
+    if criteria == Criteria.TITLE_ASCENDING:
+        return ("title", 1)
+    if criteria == Criteria.TITLE_DESCENDING:
+        return ("title", -1)
+    return ("_id", -1)
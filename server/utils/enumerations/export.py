@@ -0,0 +1,12 @@
+# Enumeration - Export
+from enum import Enum
+
+class ExportFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+
+
+def getExportMediaType(export_format:ExportFormat):
+    if export_format == ExportFormat.NDJSON:
+        return "application/x-ndjson"
+    return "application/json"
@@ -0,0 +1,48 @@
+# Export utils
+import zlib
+import orjson
+
+from utils.enumerations.export import ExportFormat
+
+# Size of the chunks sent to the client (before compression)
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+##################################################################################################
+
+def parse_fields(fields: str) -> list:
+    # "title, price" -> ["title", "price"]
+    if not fields:
+        return []
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+async def encode_stream(documents, export_format: ExportFormat, compress: bool = False):
+    # Encode the documents one by one as NDJSON lines or as items of a JSON array,
+    # yielding chunks of about EXPORT_CHUNK_SIZE bytes so the memory stays bounded
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    ndjson = export_format == ExportFormat.NDJSON
+    buffer = bytearray() if ndjson else bytearray(b"[")
+    first = True
+
+    async for document in documents:
+        if ndjson:
+            buffer += orjson.dumps(document, default=str, option=orjson.OPT_APPEND_NEWLINE)
+        else:
+            if not first:
+                buffer += b","
+            buffer += orjson.dumps(document, default=str)
+        first = False
+
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            chunk = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+            if chunk:
+                yield chunk
+
+    if not ndjson:
+        buffer += b"]"
+    chunk = bytes(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,124 @@
+# Id Generator Class
+import os
+import time
+import random
+import string
+import threading
+
+# Start of the id clocks (2024-01-01 UTC)
+ID_EPOCH = 1704067200
+
+# Numeric ids: 13 digits, 8 * 10^12 + (seconds: 30 bits | worker: 4 bits | sequence: 6 bits), above all the ids
+# of the products dataset (up to 7.26 * 10^12) so that they never meet them and sort after them
+NUMERIC_OFFSET = 8 * 10 ** 12
+NUMERIC_WORKER_BITS = 4
+NUMERIC_SEQUENCE_BITS = 6
+
+# Alphanumeric ids: 13 base62 chars of (milliseconds: 42 bits | worker: 10 bits | sequence: 25 bits)
+ALPHANUMERIC_LENGTH = 13
+ALPHANUMERIC_WORKER_BITS = 10
+ALPHANUMERIC_SEQUENCE_BITS = 25
+
+# Base62 digits in ASCII order, so that the ids sort as strings in generation order
+ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+# Distinct worker numbers of the ids (the numeric ids have the fewest worker bits)
+ID_WORKERS = 1 << NUMERIC_WORKER_BITS
+
+# Worker number of the process: claimed at startup by every server process (see claim_id_worker in mongo.py),
+# ID_WORKER is only used by a single server process
+ID_WORKER = int(os.environ.get("ID_WORKER", 0))
+if not 0 <= ID_WORKER < ID_WORKERS:
+    raise ValueError(f"ID_WORKER must be between 0 and {ID_WORKERS - 1}, not {ID_WORKER}.")
+
+class IdWorkerError(RuntimeError):
+    # No distinct worker number for the process: it could generate the ids of another one
+    pass
+
+
+class IdGenerator(object):
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(IdGenerator, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        # The clocks never go back: when a sequence is exhausted they borrow the next time unit
+        self._lock = threading.Lock()
+        self._second = 0
+        self._numeric_sequence = 0
+        self._millisecond = 0
+        self._alphanumeric_sequence = 0
+
+    def numeric(self) -> int:
+        with self._lock:
+            second = max(int(time.time()) - ID_EPOCH, self._second)
+            if second == self._second:
+                self._numeric_sequence += 1
+                if self._numeric_sequence >> NUMERIC_SEQUENCE_BITS:
+                    second += 1
+                    self._numeric_sequence = 0
+            else:
+                self._numeric_sequence = 0
+            self._second = second
+            sequence = self._numeric_sequence
+
+        return NUMERIC_OFFSET + (((second << NUMERIC_WORKER_BITS) | ID_WORKER) << NUMERIC_SEQUENCE_BITS | sequence)
+
+    def alphanumeric(self) -> str:
+        with self._lock:
+            millisecond = max(int(time.time() * 1000) - ID_EPOCH * 1000, self._millisecond)
+            if millisecond == self._millisecond:
+                self._alphanumeric_sequence += 1
+                if self._alphanumeric_sequence >> ALPHANUMERIC_SEQUENCE_BITS:
+                    millisecond += 1
+                    self._alphanumeric_sequence = random.getrandbits(ALPHANUMERIC_SEQUENCE_BITS - 1)
+            else:
+                # A random start (in the lower half, to leave room to increment) like the ULID
+                self._alphanumeric_sequence = random.getrandbits(ALPHANUMERIC_SEQUENCE_BITS - 1)
+            self._millisecond = millisecond
+            sequence = self._alphanumeric_sequence
+
+        return encode_base62((((millisecond << ALPHANUMERIC_WORKER_BITS) | ID_WORKER) << ALPHANUMERIC_SEQUENCE_BITS) | sequence)
+
+###################################################################################################
+
+def encode_base62(value: int, length: int = ALPHANUMERIC_LENGTH) -> str:
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 62)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def get_id_generator():
+    if IdGenerator._instance is None:
+        IdGenerator()
+    return IdGenerator._instance
+
+
+def set_id_worker(worker: int):
+    # Worker number claimed at startup (see claim_id_worker in mongo.py), never wrapped around: two workers
+    # sharing a number would generate the same ids
+    global ID_WORKER
+    if not 0 <= worker < ID_WORKERS:
+        raise IdWorkerError(f"Id worker {worker} out of range, at most {ID_WORKERS} processes can generate ids.")
+    ID_WORKER = worker
+
+
+def generate_id(alphanumeric: bool = False):
+    # A 13 chars string or a 13 digits number, unique and increasing without any database lookup
+    generator = get_id_generator()
+    return generator.alphanumeric() if alphanumeric else generator.numeric()
+
+
+def get_id_floor(timestamp: float, alphanumeric: bool = False):
+    # Smallest id generated at the given time, to range-scan the documents by _id
+    if alphanumeric:
+        millisecond = max(int(timestamp * 1000) - ID_EPOCH * 1000, 0)
+        return encode_base62(millisecond << (ALPHANUMERIC_WORKER_BITS + ALPHANUMERIC_SEQUENCE_BITS))
+    second = max(int(timestamp) - ID_EPOCH, 0)
+    return NUMERIC_OFFSET + (second << (NUMERIC_WORKER_BITS + NUMERIC_SEQUENCE_BITS))
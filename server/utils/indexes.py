@@ -0,0 +1,158 @@
+# Index Manager
+from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError, OperationFailure
+
+# Prefix of the names of the declared indexes: reconcile_indexes only ever drops the indexes named with it
+INDEX_PREFIX = "wtf_"
+
+# Options compared to tell if an existing index matches its declaration
+INDEX_OPTIONS = ("unique", "expireAfterSeconds")
+
+
+def declare_index(keys: list, **options) -> IndexModel:
+    # Index named after its keys like the MongoDB default name, with the INDEX_PREFIX
+    name = INDEX_PREFIX + "_".join(f"{field}_{direction}" for field, direction in keys)
+    return IndexModel(keys, name=name, **options)
+
+
+# Indexes of every collection, declared from the queries and sorts of mongo.py
+INDEXES = {
+    "Users": [
+        declare_index([("username", ASCENDING)], unique=True),              # get_user, insert_user
+        declare_index([("email", ASCENDING)])                               # get_user ($or with the email)
+    ],
+    "Orders": [
+        declare_index([("user.username", ASCENDING), ("date", DESCENDING)])   # get_orders_by_username
+    ],
+    "Products": [
+        declare_index([("interest", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)]),     # category by price
+        declare_index([("interest", ASCENDING), ("title", ASCENDING), ("_id", ASCENDING)]),     # category by title
+        declare_index([("product_type", ASCENDING)]),                                           # product type
+        declare_index([("price", ASCENDING), ("_id", ASCENDING)]),                              # price sort and keyset
+        declare_index([("title", ASCENDING), ("_id", ASCENDING)])                               # title sort and keyset
+    ],
+    "CatalogChanges": [
+        declare_index([("date", ASCENDING)], expireAfterSeconds=3600)       # changes log read by the other processes
+    ]
+}
+
+# Indexes created by the former create_product_indices under the MongoDB default names, replaced by INDEXES:
+# dropped by reconcile_indexes even though unprefixed and with keys declared nowhere
+LEGACY_INDEXES = {
+    "Products": {
+        "interest_1": [("interest", ASCENDING)],
+        "product_type_1": [("product_type", ASCENDING)],
+        "title_1": [("title", ASCENDING)],
+        "price_1": [("price", ASCENDING)]
+    }
+}
+
+# Representative query shapes, explained to check they are served by an index
+QUERY_SHAPES = [
+    {"collection": "Users", "name": "get_user", "filter": {"username": ""}},
+    {"collection": "Users", "name": "get_user (email)", "filter": {"$or": [{"username": ""}, {"email": ""}]}},
+    {"collection": "Orders", "name": "get_orders_by_username", "filter": {"user.username": ""}, "sort": [("date", -1)]},
+    {"collection": "Products", "name": "get_products_by_category", "filter": {"interest": {"$in": [""]}}},
+    {"collection": "Products", "name": "get_products_page (category, price)",
+     "filter": {"interest": {"$in": [""]}}, "sort": [("price", 1), ("_id", 1)]},
+    {"collection": "Products", "name": "get_products_page (category, title)",
+     "filter": {"interest": {"$in": [""]}}, "sort": [("title", -1), ("_id", -1)]},
+    {"collection": "Products", "name": "get_products_page (price)", "filter": {}, "sort": [("price", -1), ("_id", -1)]},
+    {"collection": "Products", "name": "get_products_page (title)", "filter": {}, "sort": [("title", 1), ("_id", 1)]},
+    {"collection": "Products", "name": "sort_product_by_price", "filter": {"price": {"$gte": 0, "$lte": 0}},
+     "sort": [("price", 1), ("_id", 1)], "limit": 101},
+    {"collection": "Products", "name": "sort_product_by_name", "filter": {}, "sort": [("title", -1), ("_id", -1)], "limit": 101}
+]
+
+# Plan stages meaning a query is not (fully) served by an index
+MISSING_INDEX_STAGES = {"COLLSCAN", "SORT"}
+
+###################################################################################################
+
+def index_spec(index: dict) -> tuple:
+    # Keys and compared options of an index, from list_indexes() or an IndexModel document
+    return list(index["key"].items()), {option: index.get(option) for option in INDEX_OPTIONS}
+
+
+def reconcile_indexes(database) -> dict:
+    # Create the declared indexes that are missing or changed and drop the prefixed ones no longer declared.
+    # The indexes created by hand are kept, unless they have the keys of a declared index (MongoDB allows one per keys)
+    # or are the LEGACY_INDEXES of a former version.
+    report = {"created": [], "dropped": [], "failed": []}
+    for collection_name, models in INDEXES.items():
+        collection = database[collection_name]
+        declared = {model.document["name"]: index_spec(model.document) for model in models}
+        declared_keys = [keys for keys, _ in declared.values()]
+        legacy = LEGACY_INDEXES.get(collection_name, {})
+        existing = {index["name"]: index_spec(index) for index in collection.list_indexes()}
+
+        for name, (keys, options) in list(existing.items()):
+            if name == "_id_":
+                continue
+            if name.startswith(INDEX_PREFIX):
+                stale = declared.get(name) != (keys, options)
+            else:
+                stale = keys in declared_keys or legacy.get(name) == keys
+            if stale:
+                collection.drop_index(name)
+                del existing[name]
+                report["dropped"].append(f"{collection_name}.{name}")
+
+        for model in models:
+            name = model.document["name"]
+            if name in existing:
+                continue
+            try:
+                collection.create_indexes([model])
+                report["created"].append(f"{collection_name}.{name}")
+            except PyMongoError as e:
+                report["failed"].append(f"{collection_name}.{name}: {e}")
+    return report
+
+
+def walk_plan(plan):
+    # Every stage of an explain() plan, whatever the nesting (inputStage, inputStages, queryPlan)
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from walk_plan(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from walk_plan(value)
+
+
+def explain_query_shapes(database) -> list:
+    # Winning plan of every query shape, flagging the ones that scan the collection or sort in memory
+    results = []
+    for shape in QUERY_SHAPES:
+        cursor = database[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        if shape.get("limit"):
+            cursor = cursor.limit(shape["limit"])
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = [stage["stage"] for stage in walk_plan(winning_plan)]
+        indexes = [stage["indexName"] for stage in walk_plan(winning_plan) if "indexName" in stage]
+        results.append({
+            "collection": shape["collection"],
+            "query": shape["name"],
+            "stages": stages,
+            "indexes": indexes,
+            "missing_index": bool(MISSING_INDEX_STAGES.intersection(stages))
+        })
+    return results
+
+
+def unused_indexes(database) -> list:
+    # Declared indexes never used since the server start ($indexStats), None if not supported
+    unused = []
+    try:
+        for collection_name in INDEXES:
+            for stats in database[collection_name].aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats.get("accesses", {}).get("ops", 0) == 0:
+                    unused.append(f"{collection_name}.{stats['name']}")
+    except (OperationFailure, NotImplementedError):
+        return None
+    return unused
+
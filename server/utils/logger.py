@@ -1,13 +1,34 @@
 # Logger Class
 import os
 import sys
+import glob
+import time
+import queue
+import atexit
+import threading
 
 from datetime import datetime as dt
 
+# Log levels (a record is dropped when its level is lower than LOG_LEVEL)
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+# Logging pipeline settings (override with environment variables)
+LOG_LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").upper(), INFO)
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 256))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 0.5))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+
 class Logger(object):
     _instance = None
     _log = None
-    
+
     def __new__(cls, filename=None, directory=None):
         if cls._instance is None:
             if filename is None or directory is None:
@@ -17,6 +38,19 @@ class Logger(object):
         return cls._instance
 
     def _initialize(self, filename=None, out_dir=None):
+        # Records are queued by the callers and written in batches by a background thread
+        self.level = LOG_LEVEL
+        self.dropped = 0
+        self.errors = 0
+        self._filename = filename
+        self._out_dir = out_dir
+        self._process = os.getpid()
+        self._written = 0
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._writer = threading.Thread(target=self._run, name="LoggerWriter", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
         if filename is not None and out_dir is not None:
             if not isinstance(filename, str) or not isinstance(out_dir, str):
                 self.write("Logging", "Error: File name and directory must be strings.")
@@ -27,22 +61,91 @@ class Logger(object):
             else:
                 if not os.path.exists(f"./{out_dir}"):
                     os.mkdir(f"./{out_dir}")
-                curr_date = dt.now().isoformat().replace(':', '-')
-                self._log = open(f"./{out_dir}/{filename}_{curr_date}.log", "x")
+                self._log = self._open_log()
         else:
             self._log = None
 
-    def write(self, tag, text):
+    def _open_log(self):
+        # Every process (e.g. a server worker) writes its own files, prefixed with its pid
+        curr_date = dt.now().isoformat().replace(':', '-')
+        return open(f"./{self._out_dir}/{self._filename}_{self._process}_{curr_date}.log", "x")
+
+    def _rotate(self):
+        # Start a new log file and keep only the most recent LOG_BACKUP_COUNT old ones of this process
+        # The new file is opened first, so that on failure the records go on in the current one
+        log = self._open_log()
+        self._log.close()
+        self._log = log
+        self._written = 0
+        old_logs = sorted(glob.glob(f"./{self._out_dir}/{self._filename}_{self._process}_*.log"))[:-1]
+        for old_log in old_logs[:max(len(old_logs) - LOG_BACKUP_COUNT, 0)]:
+            try:
+                os.remove(old_log)
+            except FileNotFoundError:
+                pass
+
+    def _run(self):
+        while True:
+            # Collect a batch until it is full or the flush interval has elapsed
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while batch[-1] is not None and len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            try:
+                self._emit("".join(record for record in batch if record is not None))
+            except Exception as e:
+                # A failed write (disk full, permissions...) loses this batch, never the writer thread
+                self.errors += 1
+                sys.stderr.write(f"[Logging - {dt.now().strftime('%H:%M:%S')}] Error: writing the logs failed: {e!r}\n")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _emit(self, chunk):
+        if not chunk:
+            return
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+
+        if self._log is not None:
+            self._log.write(chunk)
+            self._log.flush()
+            self._written += len(chunk)
+            if self._written >= LOG_MAX_BYTES:
+                self._rotate()
+
+    def write(self, tag, text, level=INFO):
+        if level < self.level:
+            return
         curr_time = dt.now().strftime("%H:%M:%S")
         log_message = f"[{tag} - {curr_time}] {text}\n"
-        sys.stdout.write(log_message)
-        
-        if self._log is not None:
-            self._log.write(log_message)
-        
+        try:
+            self._queue.put_nowait(log_message)
+        except queue.Full:
+            # Never block the event loop on logging, count the lost record instead
+            self.dropped += 1
+
     def flush(self):
-        if self._log is not None:
-            self._log.flush()
+        # Wait until every queued record has been written out
+        if self._writer.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self._log is not None and not self._log.closed:
+            self._log.close()
 
 ###################################################################################################
 
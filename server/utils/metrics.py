@@ -0,0 +1,315 @@
+# Request Metrics Class
+import time
+import threading
+
+from pymongo import monitoring
+
+# Sub-buckets per power of two of the latency histograms (about 6% of precision)
+SUB_BUCKETS = 16
+
+# Quantiles reported for every route
+QUANTILES = (0.5, 0.9, 0.99)
+
+class LatencyHistogram(object):
+    # HDR-style histogram of microseconds: log-linear buckets, constant time record
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self._counts = {}   # bucket index -> count
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < 2 * SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - SUB_BUCKETS.bit_length()
+        return shift * SUB_BUCKETS + (value >> shift)
+
+    @staticmethod
+    def _upper_bound(index: int) -> int:
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        return ((index - shift * SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, value: int):
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, quantile: float) -> int:
+        if self.count == 0:
+            return 0
+        rank = quantile * self.count
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+
+class RouteStats(object):
+
+    def __init__(self):
+        self.bytes = 0
+        self.statuses = {}
+        self.latency = LatencyHistogram()
+
+
+class RequestMetrics(object):
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RequestMetrics, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.in_flight = 0
+        self._routes = {}   # (method, route path) -> statistics
+
+    def route(self, method: str, path: str) -> RouteStats:
+        key = (method, path)
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = RouteStats()
+        return stats
+
+    def reset(self):
+        self._routes.clear()
+
+    def stats(self) -> dict:
+        # Routes sorted from the slowest (99th percentile)
+        routes = []
+        for (method, path), stats in self._routes.items():
+            latency = stats.latency
+            routes.append({
+                "method": method,
+                "route": path,
+                "count": latency.count,
+                "mean_ms": round(latency.total / latency.count / 1000, 3) if latency.count else 0.0,
+                **{f"p{int(quantile * 100)}_ms": round(latency.quantile(quantile) / 1000, 3) for quantile in QUANTILES},
+                "max_ms": round(latency.max / 1000, 3),
+                "bytes": stats.bytes,
+                "statuses": {str(status): count for status, count in sorted(stats.statuses.items())}
+            })
+        routes.sort(key=lambda route: route["p99_ms"], reverse=True)
+        return {"in_flight": self.in_flight, "routes": routes}
+
+    def prometheus(self) -> str:
+        # Prometheus text exposition format (latencies as summaries)
+        items = sorted(self._routes.items())
+        lines = [
+            "# HELP wtfunko_http_requests_in_flight Requests being served.",
+            "# TYPE wtfunko_http_requests_in_flight gauge",
+            f"wtfunko_http_requests_in_flight {self.in_flight}",
+            "# HELP wtfunko_http_request_duration_seconds Latency of the requests by route.",
+            "# TYPE wtfunko_http_request_duration_seconds summary"
+        ]
+        for (method, path), stats in items:
+            labels = f'method="{method}",route="{path}"'
+            for quantile in QUANTILES:
+                lines.append(f'wtfunko_http_request_duration_seconds{{{labels},quantile="{quantile}"}} '
+                             f'{stats.latency.quantile(quantile) / 1e6}')
+            lines.append(f"wtfunko_http_request_duration_seconds_sum{{{labels}}} {stats.latency.total / 1e6}")
+            lines.append(f"wtfunko_http_request_duration_seconds_count{{{labels}}} {stats.latency.count}")
+
+        lines.append("# HELP wtfunko_http_response_bytes_total Bytes of the response bodies by route.")
+        lines.append("# TYPE wtfunko_http_response_bytes_total counter")
+        for (method, path), stats in items:
+            lines.append(f'wtfunko_http_response_bytes_total{{method="{method}",route="{path}"}} {stats.bytes}')
+
+        lines.append("# HELP wtfunko_http_responses_total Responses by route and status code.")
+        lines.append("# TYPE wtfunko_http_responses_total counter")
+        for (method, path), stats in items:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'wtfunko_http_responses_total{{method="{method}",route="{path}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware(object):
+    # Plain ASGI middleware (no request/response objects are built around the app)
+
+    def __init__(self, app):
+        self.app = app
+        self.metrics = get_request_metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = int((time.perf_counter() - start) * 1e6)
+            metrics.in_flight -= 1
+            # The router stores the matched route in the scope, unmatched paths share one label
+            route = scope.get("route")
+            stats = metrics.route(scope["method"], getattr(route, "path", "unmatched"))
+            stats.latency.record(elapsed)
+            stats.bytes += response["bytes"]
+            stats.statuses[response["status"]] = stats.statuses.get(response["status"], 0) + 1
+
+class PoolStats(object):
+    # Connections of the pools of one client (all the servers together)
+
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.failures = {}
+        self.wait = LatencyHistogram()
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    # The events come from the threads of the driver, the counters are updated under a lock
+
+    def __init__(self, stats: PoolStats, lock: threading.Lock):
+        self._stats = stats
+        self._lock = lock
+
+    def connection_created(self, event):
+        with self._lock:
+            self._stats.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._stats.open -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._stats.waiting += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._stats.waiting -= 1
+            self._stats.checked_out += 1
+            self._stats.wait.record(int(event.duration * 1e6))
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._stats.waiting -= 1
+            self._stats.failures[event.reason] = self._stats.failures.get(event.reason, 0) + 1
+            self._stats.wait.record(int(event.duration * 1e6))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._stats.checked_out -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+class PoolMetrics(object):
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PoolMetrics, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._lock = threading.Lock()
+        self._clients = {}  # client name -> statistics
+
+    def listener(self, name: str, max_pool_size: int) -> PoolListener:
+        stats = self._clients[name] = PoolStats(max_pool_size)
+        return PoolListener(stats, self._lock)
+
+    def stats(self) -> dict:
+        clients = {}
+        with self._lock:
+            for name, stats in sorted(self._clients.items()):
+                wait = stats.wait
+                clients[name] = {
+                    "max_pool_size": stats.max_pool_size,
+                    "open": stats.open,
+                    "checked_out": stats.checked_out,
+                    "waiting": stats.waiting,
+                    "saturation": round(stats.checked_out / stats.max_pool_size, 3) if stats.max_pool_size else 0.0,
+                    "checkouts": wait.count,
+                    "wait_mean_ms": round(wait.total / wait.count / 1000, 3) if wait.count else 0.0,
+                    **{f"wait_p{int(quantile * 100)}_ms": round(wait.quantile(quantile) / 1000, 3) for quantile in QUANTILES},
+                    "wait_max_ms": round(wait.max / 1000, 3),
+                    "failures": dict(stats.failures)
+                }
+        return clients
+
+    def prometheus(self) -> str:
+        # Prometheus text exposition format (checkout waits as summaries)
+        with self._lock:
+            items = sorted(self._clients.items())
+            gauges = [
+                ("open", "Open connections of the pool."),
+                ("checked_out", "Connections in use."),
+                ("waiting", "Operations waiting for a connection."),
+                ("max_pool_size", "Maximum size of the pool.")
+            ]
+            lines = []
+            for gauge, help_text in gauges:
+                lines.append(f"# HELP wtfunko_mongo_pool_{gauge} {help_text}")
+                lines.append(f"# TYPE wtfunko_mongo_pool_{gauge} gauge")
+                for name, stats in items:
+                    lines.append(f'wtfunko_mongo_pool_{gauge}{{client="{name}"}} {getattr(stats, gauge)}')
+
+            lines.append("# HELP wtfunko_mongo_pool_checkout_wait_seconds Time waited to check out a connection.")
+            lines.append("# TYPE wtfunko_mongo_pool_checkout_wait_seconds summary")
+            for name, stats in items:
+                for quantile in QUANTILES:
+                    lines.append(f'wtfunko_mongo_pool_checkout_wait_seconds{{client="{name}",quantile="{quantile}"}} '
+                                 f'{stats.wait.quantile(quantile) / 1e6}')
+                lines.append(f'wtfunko_mongo_pool_checkout_wait_seconds_sum{{client="{name}"}} {stats.wait.total / 1e6}')
+                lines.append(f'wtfunko_mongo_pool_checkout_wait_seconds_count{{client="{name}"}} {stats.wait.count}')
+
+            lines.append("# HELP wtfunko_mongo_pool_checkout_failures_total Failed checkouts by reason.")
+            lines.append("# TYPE wtfunko_mongo_pool_checkout_failures_total counter")
+            for name, stats in items:
+                for reason, count in sorted(stats.failures.items()):
+                    lines.append(f'wtfunko_mongo_pool_checkout_failures_total{{client="{name}",reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+###################################################################################################
+
+def get_request_metrics():
+    if RequestMetrics._instance is None:
+        RequestMetrics()
+    return RequestMetrics._instance
+
+
+def get_pool_metrics():
+    if PoolMetrics._instance is None:
+        PoolMetrics()
+    return PoolMetrics._instance
@@ -0,0 +1,204 @@
+# Query Profiler Class
+import os
+import time
+import random
+import asyncio
+import functools
+import contextvars
+
+from pymongo import monitoring
+
+from utils.indexes import walk_plan
+
+# Profiling settings (override with environment variables)
+QUERY_PROFILING = os.environ.get("QUERY_PROFILING", "false").lower() == "true"
+QUERY_PROFILING_SAMPLE = float(os.environ.get("QUERY_PROFILING_SAMPLE", 0.05))
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Commands that can be explained, and the fields of a command that explain does not accept
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction"}
+
+class QueryListener(monitoring.CommandListener):
+    # Collects the commands run by the profiled call of the current context
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+
+    def started(self, event):
+        call = self._profiler.current.get()
+        if call is not None and event.command_name in EXPLAINABLE_COMMANDS:
+            command = {key: value for key, value in event.command.items()
+                       if not key.startswith("$") and key not in SESSION_FIELDS}
+            call.append(command)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class QueryProfiler(object):
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(QueryProfiler, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        # Only a sample of the calls is timed and explained, the others run untouched
+        self.enabled = QUERY_PROFILING
+        self.sample_rate = QUERY_PROFILING_SAMPLE
+        self.database = None                    # async database used to explain the sampled commands
+        self.listener = QueryListener(self)
+        self.current = contextvars.ContextVar("profiled_call", default=None)
+        self._stats = {}                        # function name -> statistics
+        self._tasks = set()
+
+    def profile(self, function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            if not self.enabled or random.random() >= self.sample_rate:
+                return await function(*args, **kwargs)
+
+            commands = []
+            token = self.current.set(commands)
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.current.reset(token)
+                self._record(function.__name__, elapsed, commands)
+        return wrapper
+
+    def _get_stats(self, name: str) -> dict:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {
+                "calls": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "explained": 0,
+                "docs_examined": 0,
+                "keys_examined": 0,
+                "returned": 0,
+                "indexes": {}
+            }
+        return stats
+
+    def _record(self, name: str, elapsed: float, commands: list):
+        stats = self._get_stats(name)
+        stats["calls"] += 1
+        stats["seconds"] += elapsed
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                stats["buckets"][i] += 1
+                break
+
+        # Explain the commands in the background, the call does not wait for it
+        if commands and self.database is not None:
+            task = asyncio.get_running_loop().create_task(self._explain(name, commands))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, name: str, commands: list):
+        stats = self._get_stats(name)
+        for command in commands:
+            try:
+                result = await self.database.command({"explain": command, "verbosity": "executionStats"})
+            except Exception:
+                continue
+            execution = next(find_key(result, "executionStats"), {})
+            stats["explained"] += 1
+            stats["docs_examined"] += execution.get("totalDocsExamined", 0)
+            stats["keys_examined"] += execution.get("totalKeysExamined", 0)
+            stats["returned"] += execution.get("nReturned", 0)
+
+            plan = next(find_key(result, "winningPlan"), {})
+            indexes = {stage["indexName"] for stage in walk_plan(plan) if "indexName" in stage}
+            if not indexes and any(stage["stage"] == "COLLSCAN" for stage in walk_plan(plan)):
+                indexes = {"COLLSCAN"}
+            for index in indexes:
+                stats["indexes"][index] = stats["indexes"].get(index, 0) + 1
+
+    def reset(self):
+        self._stats.clear()
+
+    def stats(self) -> dict:
+        functions = {}
+        for name, stats in sorted(self._stats.items()):
+            functions[name] = {
+                "calls": stats["calls"],
+                "mean_ms": round(stats["seconds"] / stats["calls"] * 1000, 3) if stats["calls"] else 0.0,
+                "histogram": {str(bound): count for bound, count in zip(LATENCY_BUCKETS, stats["buckets"])},
+                "explained": stats["explained"],
+                "docs_examined": stats["docs_examined"],
+                "keys_examined": stats["keys_examined"],
+                "returned": stats["returned"],
+                "indexes": dict(stats["indexes"])
+            }
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "functions": functions}
+
+    def prometheus(self) -> str:
+        # Prometheus text exposition format (counts are of the sampled calls)
+        lines = [
+            "# HELP wtfunko_query_duration_seconds Latency of the sampled data-access calls.",
+            "# TYPE wtfunko_query_duration_seconds histogram"
+        ]
+        for name, stats in sorted(self._stats.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+                cumulative += count
+                lines.append(f'wtfunko_query_duration_seconds_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'wtfunko_query_duration_seconds_bucket{{function="{name}",le="+Inf"}} {stats["calls"]}')
+            lines.append(f'wtfunko_query_duration_seconds_sum{{function="{name}"}} {stats["seconds"]}')
+            lines.append(f'wtfunko_query_duration_seconds_count{{function="{name}"}} {stats["calls"]}')
+
+        counters = [
+            ("explained", "Sampled commands explained."),
+            ("docs_examined", "Documents examined by the explained commands."),
+            ("keys_examined", "Index keys examined by the explained commands."),
+            ("returned", "Documents returned by the explained commands.")
+        ]
+        for counter, help_text in counters:
+            lines.append(f"# HELP wtfunko_query_{counter}_total {help_text}")
+            lines.append(f"# TYPE wtfunko_query_{counter}_total counter")
+            for name, stats in sorted(self._stats.items()):
+                lines.append(f'wtfunko_query_{counter}_total{{function="{name}"}} {stats[counter]}')
+
+        lines.append("# HELP wtfunko_query_index_total Explained commands by index used (COLLSCAN for none).")
+        lines.append("# TYPE wtfunko_query_index_total counter")
+        for name, stats in sorted(self._stats.items()):
+            for index, count in sorted(stats["indexes"].items()):
+                lines.append(f'wtfunko_query_index_total{{function="{name}",index="{index}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+###################################################################################################
+
+def find_key(document, key):
+    # Values of a key at any depth of an explain() result
+    if isinstance(document, dict):
+        if key in document:
+            yield document[key]
+        for value in document.values():
+            yield from find_key(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from find_key(value, key)
+
+
+def get_query_profiler():
+    if QueryProfiler._instance is None:
+        QueryProfiler()
+    return QueryProfiler._instance
+
+
+def profiled(function):
+    # Decorator of the data-access functions (a no-op unless QUERY_PROFILING is enabled)
+    return get_query_profiler().profile(function)
@@ -0,0 +1,112 @@
+# Related Graph Class
+import heapq
+
+# Product fields the graph needs to be built (and rebuilt on update)
+RELATED_FIELDS = {"_id", "related", "interest", "license"}
+
+# Weight of a shared value in the similarity fallback
+SIMILARITY_WEIGHTS = {"license": 2.0, "interest": 1.0}
+
+class RelatedGraph(object):
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RelatedGraph, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.ready = False
+        self._related = {}      # product id -> related product ids (normalized, in the dataset order)
+        self._values = {}       # product id -> {field: values} of the similarity fields
+        self._products = {}     # (field, value) -> ids of the products holding it
+
+    @staticmethod
+    def normalize_id(product_id):
+        # The dataset stores the related ids as strings while the _id are integers
+        if isinstance(product_id, str) and product_id.lstrip("-").isdigit():
+            return int(product_id)
+        return product_id
+
+    @classmethod
+    def prepare(cls, products):
+        # A detached graph of the products, built without touching the one being read
+        graph = object.__new__(cls)
+        graph._initialize()
+        for product in products:
+            graph.add(product)
+        graph.ready = True
+        return graph
+
+    def replace(self, graph):
+        # Swap in a prepared graph with one assignment, the readers never see it half built
+        self.__dict__ = graph.__dict__
+
+    def build(self, products):
+        self.replace(self.prepare(products))
+
+    def clear(self):
+        ready = self.ready
+        self._initialize()
+        self.ready = ready
+
+    def __contains__(self, product_id):
+        return product_id in self._values
+
+    def add(self, product: dict):
+        product_id = product["_id"]
+        self.remove(product_id)
+        self._related[product_id] = list(dict.fromkeys(
+            self.normalize_id(related_id) for related_id in product.get("related") or []))
+        values = {}
+        for field in SIMILARITY_WEIGHTS:
+            values[field] = set(product.get(field) or [])
+            for value in values[field]:
+                self._products.setdefault((field, value), set()).add(product_id)
+        self._values[product_id] = values
+
+    def remove(self, product_id):
+        # The references to a removed product become dangling and are skipped by resolve
+        values = self._values.pop(product_id, None)
+        self._related.pop(product_id, None)
+        if values is None:
+            return
+        for field, field_values in values.items():
+            for value in field_values:
+                products = self._products[(field, value)]
+                products.discard(product_id)
+                if not products:
+                    del self._products[(field, value)]
+
+    def dangling(self) -> int:
+        # References to products missing from the catalog
+        return sum(1 for related in self._related.values() for related_id in related if related_id not in self._values)
+
+    def similar(self, product_id, limit: int, exclude=()) -> list:
+        # Products sharing the most licenses and interests with the given one
+        scores = {}
+        for field, field_values in self._values.get(product_id, {}).items():
+            weight = SIMILARITY_WEIGHTS[field]
+            for value in field_values:
+                for other_id in self._products.get((field, value), ()):
+                    scores[other_id] = scores.get(other_id, 0.0) + weight
+        scores.pop(product_id, None)
+        for excluded_id in exclude:
+            scores.pop(excluded_id, None)
+        return [other_id for other_id, _ in heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], str(item[0])))]
+
+    def resolve(self, product_id, limit: int, fallback: bool = True) -> list:
+        # Related products still in the catalog, completed by the most similar ones
+        related = [related_id for related_id in self._related.get(product_id, [])
+                   if related_id != product_id and related_id in self._values][:limit]
+        if fallback and len(related) < limit:
+            related += self.similar(product_id, limit - len(related), exclude=related)
+        return related
+
+###################################################################################################
+
+def get_related_graph():
+    if RelatedGraph._instance is None:
+        RelatedGraph()
+    return RelatedGraph._instance
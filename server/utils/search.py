@@ -0,0 +1,199 @@
+# Search Index Class
+import re
+from bisect import bisect_left, insort
+
+from utils.enumerations.criteria import Criteria
+
+# Weight of a token by the product field it comes from
+FIELD_WEIGHTS = {"title": 3.0, "product_type": 2.0, "description": 1.0}
+
+# Product fields counted by the facets (list fields count every value once)
+FACET_FIELDS = ("interest", "product_type", "license", "vendor")
+
+# Product fields the index needs to be built (and rebuilt on update)
+INDEX_FIELDS = {"_id", "title", "product_type", "description", "interest", "price", "license", "vendor"}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+class SearchIndex(object):
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SearchIndex, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.ready = False
+        self._postings = {}     # token -> {product id: weight}
+        self._terms = []        # sorted tokens, for prefix lookups
+        self._documents = {}    # product id -> indexed fields of the product
+        self._sequence = 0      # insertion counter, mirrors the $natural order
+        self._facets = {field: {} for field in FACET_FIELDS}    # field -> {value: products count}
+
+    @staticmethod
+    def tokenize(text: str) -> list:
+        return TOKEN_PATTERN.findall(str(text).lower())
+
+    @staticmethod
+    def facet_values(product: dict) -> dict:
+        values = {}
+        for field in FACET_FIELDS:
+            value = product.get(field)
+            if isinstance(value, list):
+                values[field] = tuple(dict.fromkeys(item for item in value if item is not None))
+            else:
+                values[field] = () if value is None else (value,)
+        return values
+
+    @classmethod
+    def prepare(cls, products):
+        # A detached index of the products, built without touching the one being read
+        index = object.__new__(cls)
+        index._initialize()
+        for product in products:
+            index.add(product)
+        index.ready = True
+        return index
+
+    def replace(self, index):
+        # Swap in a prepared index with one assignment, the readers never see it half built
+        self.__dict__ = index.__dict__
+
+    def build(self, products):
+        self.replace(self.prepare(products))
+
+    def clear(self):
+        ready = self.ready
+        self._initialize()
+        self.ready = ready
+
+    def add(self, product: dict):
+        # A reindexed product keeps its original position in the insertion order
+        product_id = product["_id"]
+        sequence = None
+        if product_id in self._documents:
+            sequence = self._documents[product_id]["sequence"]
+            self.remove(product_id)
+
+        # Weight every token by the fields it appears in
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in self.tokenize(product.get(field, "")):
+                weights[token] = weights.get(token, 0.0) + weight
+
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._terms, token)
+            postings[product_id] = weight
+
+        # Keep the precomputed facet counts of the whole catalog up to date
+        facets = self.facet_values(product)
+        for field, values in facets.items():
+            counts = self._facets[field]
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+
+        if sequence is None:
+            self._sequence += 1
+            sequence = self._sequence
+        self._documents[product_id] = {
+            "terms": list(weights),
+            "interest": set(product.get("interest", [])),
+            "price": product.get("price", 0.0),
+            "title": product.get("title", ""),
+            "facets": facets,
+            "sequence": sequence
+        }
+
+    def remove(self, product_id):
+        document = self._documents.pop(product_id, None)
+        if document is None:
+            return
+        for token in document["terms"]:
+            postings = self._postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._terms[bisect_left(self._terms, token)]
+        for field, values in document["facets"].items():
+            counts = self._facets[field]
+            for value in values:
+                counts[value] -= 1
+                if counts[value] == 0:
+                    del counts[value]
+
+    def _match_token(self, token: str) -> dict:
+        # A query token matches every indexed token it is a prefix of (exact matches score double)
+        scores = {}
+        position = bisect_left(self._terms, token)
+        while position < len(self._terms) and self._terms[position].startswith(token):
+            term = self._terms[position]
+            boost = 2.0 if term == token else 1.0
+            for product_id, weight in self._postings[term].items():
+                scores[product_id] = max(scores.get(product_id, 0.0), weight * boost)
+            position += 1
+        return scores
+
+    def match(self, searchTerm: str, category: str = "All") -> dict:
+        # Products containing all the query tokens, with their relevance score
+        tokens = self.tokenize(searchTerm)
+        if not tokens:
+            scores = dict.fromkeys(self._documents, 0.0)
+        else:
+            scores = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                token_scores = self._match_token(token)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {product_id: score + token_scores[product_id]
+                              for product_id, score in scores.items() if product_id in token_scores}
+                if not scores:
+                    return {}
+
+        if category.lower() != "all":
+            scores = {product_id: score for product_id, score in scores.items()
+                      if category in self._documents[product_id]["interest"]}
+        return scores
+
+    def count(self, searchTerm: str, category: str = "All") -> int:
+        if not self.tokenize(searchTerm) and category.lower() == "all":
+            return len(self._documents)
+        return len(self.match(searchTerm, category))
+
+    def facets(self, searchTerm: str = "", category: str = "All") -> dict:
+        # Products count by value of every facet field, precomputed for the whole catalog
+        if not self.tokenize(searchTerm) and category.lower() == "all":
+            return {field: dict(counts) for field, counts in self._facets.items()}
+
+        facets = {field: {} for field in FACET_FIELDS}
+        for product_id in self.match(searchTerm, category):
+            for field, values in self._documents[product_id]["facets"].items():
+                counts = facets[field]
+                for value in values:
+                    counts[value] = counts.get(value, 0) + 1
+        return facets
+
+    def search(self, searchTerm: str, category: str = "All", criteria: Criteria = Criteria.DEFAULT) -> list:
+        # Ids of the matching products, ranked by relevance or sorted by the criteria
+        scores = self.match(searchTerm, category)
+        documents = self._documents
+        if criteria in (Criteria.PRICE_ASCENDING, Criteria.PRICE_DESCENDING):
+            key = lambda product_id: (documents[product_id]["price"], documents[product_id]["sequence"])
+        elif criteria in (Criteria.TITLE_ASCENDING, Criteria.TITLE_DESCENDING):
+            key = lambda product_id: (documents[product_id]["title"], documents[product_id]["sequence"])
+        else:
+            key = lambda product_id: (scores[product_id], documents[product_id]["sequence"])
+        reverse = criteria not in (Criteria.PRICE_ASCENDING, Criteria.TITLE_ASCENDING)
+        return sorted(scores, key=key, reverse=reverse)
+
+###################################################################################################
+
+def get_search_index():
+    if SearchIndex._instance is None:
+        SearchIndex()
+    return SearchIndex._instance
@@ -9,9 +9,15 @@ import pandas as pd
 
 # OS libraries
 import os
+import sys
+
+# Concurrency libraries
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # Struct libreries
 import json
+import orjson
 
 # String libraries
 import re
@@ -20,58 +26,72 @@ from ast import literal_eval
 
 ##################################################################################################
 
+# Columns holding the string representation of a python list
+LIST_COLUMNS = ["interest", "license", "tags", "form_factor", "feature", "related"]
+# Useless columns dropped from the dataset
+DROP_COLUMNS = ["created_at", "published_at", "updated_at", "gid", "handle"]
+
+# Values parsed by one task of the process pool
+LITERALS_BATCH_SIZE = 10000
+
+HTML_TAGS = r"<.*?>"
+NOT_PRINTABLE = f"[^{re.escape(string.printable)}]"
+
 # Extraction of the Funko Pop Dataset
 # (download here: https://www.kaggle.com/datasets/victorsoeiro/funko-pop-dataset)
-def extract_funko_dataset(filename: str):
-    # Read the CSV file
-    df = pd.read_csv(filename)
-    
-    # An empty dict
-    data = {}
-    
-    # Iter on the dataframe
-    for index, row in df.iterrows():
-        # Get uid of the Funko
-        key = f"funko_{row.iloc[0]}"
-        
-        # Get all the values (transform to dict)
-        values = row.iloc[:].to_dict()
-        
-        # Clean the dataset
-        clean_values(values)
+def extract_funko_dataset(filename: str, json_file: str = None, ndjson: bool = False,
+                          workers: int = 0, chunksize: int = 50000) -> int:
+    # Define JSON filename (a dict of funko_<uid> -> product, or one product per line)
+    if json_file is None:
+        json_file = os.path.join('./source/json/', 'funko.ndjson' if ndjson else 'funko.json')
 
-        # Add to the data dict the key/values from dataframe
-        data[key] = values
-    
-    # Define JSON filename
-    json_file = os.path.join('./source/json/funko.json')
-       
-    # Convert dict to json and create the json_file
-    with open(json_file, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4)
-
-def clean_values(values: dict):
-    
-    # Clean the description
-    cleanr = re.compile('<.*?>')
-    description = values["description"]
-    cleantext = re.sub(cleanr, '', description)
-    
-    # Remove special characters (in description)
-    cleantext = ''.join(filter(lambda x: x in string.printable, cleantext))
-    values["description"] = cleantext
-    
-    # Convert strings representing python struct to the respective python struct
-    values['interest'] = literal_eval(values['interest'])
-    values['license'] = literal_eval(values['license'])
-    values['tags'] = literal_eval(values['tags'])
-    values['form_factor'] = literal_eval(values['form_factor'])
-    values['feature'] = literal_eval(values['feature'])
-    values['related'] = literal_eval(values['related'])
-    
+    # Parse the list columns on a process pool if more than one worker is asked
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    rows = 0
+    try:
+        with open(json_file, 'wb') as file:
+            file.write(b"" if ndjson else b"{")
+            # Read, clean and write the CSV file by chunks of rows
+            for df in pd.read_csv(filename, chunksize=chunksize):
+                uid_column = df.columns[0]
+                for values in clean_dataframe(df, executor).to_dict("records"):
+                    if ndjson:
+                        file.write(orjson.dumps(values, option=orjson.OPT_APPEND_NEWLINE))
+                    else:
+                        file.write(b"," if rows > 0 else b"")
+                        file.write(orjson.dumps(f"funko_{values[uid_column]}") + b":" + orjson.dumps(values))
+                    rows += 1
+            file.write(b"" if ndjson else b"}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return rows
+
+def clean_dataframe(df: pd.DataFrame, executor: ProcessPoolExecutor = None) -> pd.DataFrame:
     # Drop useless attributes
-    for attr_to_drop in ["created_at", "published_at", "updated_at", "gid", "handle"]:
-        values.pop(attr_to_drop, None)
+    df = df.drop(columns=DROP_COLUMNS, errors="ignore")
+
+    # Clean the description (HTML tags and special characters)
+    df["description"] = (df["description"].fillna("")
+                         .str.replace(HTML_TAGS, "", regex=True)
+                         .str.replace(NOT_PRINTABLE, "", regex=True))
+
+    # Convert strings representing python struct to the respective python struct
+    if executor is None:
+        for column in LIST_COLUMNS:
+            df[column] = parse_literals(df[column].tolist())
+    else:
+        futures = {}
+        for column in LIST_COLUMNS:
+            values = df[column].tolist()
+            futures[column] = [executor.submit(parse_literals, values[i:i + LITERALS_BATCH_SIZE])
+                               for i in range(0, len(values), LITERALS_BATCH_SIZE)]
+        for column, column_futures in futures.items():
+            df[column] = [value for future in column_futures for value in future.result()]
+    return df
+
+def parse_literals(values: list) -> list:
+    return [literal_eval(value) if isinstance(value, str) else [] for value in values]
 
 ##################################################################################################
 
@@ -87,6 +107,70 @@ def read_json(json_file):
         
     return data
 
+JSON_SEPARATORS = re.compile(r"[\s,]*")
+JSON_COLON = re.compile(r"\s*:\s*")
+
+def iter_json(json_file: str, chunk_size: int = 65536):
+    # Incrementally yield the documents of a JSON file (the values of a top level object,
+    # the items of a top level array or the lines of a NDJSON file) reading it by chunks
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r', encoding='utf-8') as file:
+        state = {"buffer": file.read(chunk_size), "position": 0, "eof": False}
+
+        def fill() -> bool:
+            # Drop the consumed text and read the next chunk
+            if state["eof"]:
+                return False
+            chunk = file.read(chunk_size)
+            state["eof"] = not chunk
+            state["buffer"] = state["buffer"][state["position"]:] + chunk
+            state["position"] = 0
+            return not state["eof"]
+
+        position = JSON_SEPARATORS.match(state["buffer"]).end()
+        container = state["buffer"][position:position + 1]
+        container = container if container in ("{", "[") and not json_file.endswith(".ndjson") else None
+        state["position"] = position + (1 if container else 0)
+
+        while True:
+            buffer = state["buffer"]
+            position = JSON_SEPARATORS.match(buffer, state["position"]).end()
+            state["position"] = position
+            if position == len(buffer):
+                if fill():
+                    continue
+                return
+            if container and buffer[position] in "}]":
+                return
+            try:
+                if container == "{":
+                    _, end = decoder.raw_decode(buffer, position)
+                    colon = JSON_COLON.match(buffer, end)
+                    if colon is None or colon.end() == len(buffer):
+                        raise json.JSONDecodeError("Expecting ':' delimiter", buffer, end)
+                    value, end = decoder.raw_decode(buffer, colon.end())
+                else:
+                    value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The document continues in the next chunk
+                if fill():
+                    continue
+                raise
+            if end == len(buffer) and fill():
+                # A number at the end of the chunk could be truncated
+                continue
+            state["position"] = end
+            yield value
+
+def get_peak_memory() -> int:
+    # High-water mark of the process resident memory in bytes (None where not available)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
 def save_to_json(filename: str, data: dict) -> bool:
     try:
         # Create and open the JSON file
@@ -124,14 +208,35 @@ def append_to_json(filename: str, data: dict) -> bool:
 
 ##################################################################################################
 
+# Hashing settings (override with environment variables)
+HASH_ROUNDS = int(os.environ.get("HASH_ROUNDS", 12))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", 64))
+
+# bcrypt releases the GIL, so a small thread pool runs hashes in parallel off the event loop
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="Hashing")
+HASH_SLOTS = asyncio.Semaphore(HASH_MAX_PENDING)
+
 # Generate Hash
 def hash_string(string: str) -> bytes:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=HASH_ROUNDS)
     hashed = bcrypt.hashpw(string.encode('utf-8'), salt)
     return hashed.decode("utf-8")
 
 def hash_string_match(string: str, hashed: str) -> bool:
     return bcrypt.checkpw(string.encode('utf-8'), hashed.encode('utf-8'))
+
+async def run_hashing(function, *args):
+    # At most HASH_MAX_PENDING hashes are queued, later callers wait for a free slot
+    async with HASH_SLOTS:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(HASH_EXECUTOR, function, *args)
+
+async def async_hash_string(string: str) -> str:
+    return await run_hashing(hash_string, string)
+
+async def async_hash_string_match(string: str, hashed: str) -> bool:
+    return await run_hashing(hash_string_match, string, hashed)
     
 # Generate UID
 def generate_unique_id(length: int, alphanumeric: bool = False):